@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from vignette import (allow_large_images, apply_vignette, create_circular_mask, create_scaled_mask,
+                      decode_image, encode_image, make_settings, mask_cache, process_image, write_file,
+                      _vignette_geometry)
+
+DEFAULT_SIZES = (1, 4, 12, 24, 50)
+DEFAULT_FORMATS = ('jpg', 'png', 'tif', 'webp')
+
+def synthetic_image(megapixels, seed=0):
+    """Build a reproducible 3:2 RGB test image of about ``megapixels`` MP.
+
+    A smooth gradient with mild noise compresses roughly like a photo,
+    unlike flat color or pure noise.
+    """
+    width = int(round((megapixels * 1e6 * 1.5) ** 0.5))
+    height = int(round(width / 1.5))
+    rng = np.random.default_rng(seed)
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    x = np.linspace(0, 231, width, dtype=np.float32)
+    y = np.linspace(0, 231, height, dtype=np.float32)[:, None]
+    pixels[..., 0] = x
+    pixels[..., 1] = y
+    pixels[..., 2] = (x + y) / 2
+    pixels += rng.integers(0, 24, size=pixels.shape, dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+def measure(func, repeat):
+    """Return the median wall time of ``repeat`` calls of ``func``."""
+    samples = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start_time)
+    return statistics.median(samples)
+
+def run_benchmarks(sizes, formats, repeat, reference=True, log=print):
+    """Time each stage on synthetic images and return {case: seconds}.
+
+    Cases are named ``<size>MP/<stage>`` for stages that do not depend on
+    the file format and ``<size>MP/<format>/<stage>`` for those that do.
+    """
+    settings = make_settings()
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for megapixels in sizes:
+            source = synthetic_image(megapixels)
+            radius, strength = _vignette_geometry(source.size, settings)
+            prefix = f"{megapixels:g}MP"
+            log(f"{prefix}: {source.width}x{source.height}")
+
+            if reference:
+                results[f"{prefix}/create_circular_mask"] = measure(
+                    lambda: create_circular_mask(source.size, radius, strength), repeat)
+            results[f"{prefix}/mask"] = measure(
+                lambda: create_scaled_mask(source.size, radius, strength, 0), repeat)
+
+            mask_cache.clear()
+            apply_vignette(source.copy(), settings)  # warm the mask cache
+            copies = [source.copy() for _ in range(repeat)]
+            results[f"{prefix}/composite"] = measure(lambda: apply_vignette(copies.pop(), settings), repeat)
+
+            for fmt in formats:
+                path = os.path.join(folder, f"source.{fmt}")
+                out_path = os.path.join(folder, f"out.{fmt}")
+                source.save(path)
+                data = encode_image(source, out_path)
+                results[f"{prefix}/{fmt}/decode"] = measure(lambda: decode_image(path), repeat)
+                results[f"{prefix}/{fmt}/encode"] = measure(lambda: encode_image(source, out_path), repeat)
+                results[f"{prefix}/{fmt}/write"] = measure(lambda: write_file(data, out_path), repeat)
+                results[f"{prefix}/{fmt}/process_image"] = measure(
+                    lambda: process_image(path, out_path, settings), repeat)
+                os.remove(path)
+                os.remove(out_path)
+            mask_cache.clear()
+    return results
+
+def environment():
+    """Describe the machine and library versions the results came from."""
+    return {
+        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'pillow': PIL.__version__,
+        'numpy': np.__version__,
+    }
+
+def compare(results, baseline, threshold, min_seconds=0.005):
+    """Return the cases that got slower than ``baseline`` by more than ``threshold``.
+
+    Differences under ``min_seconds`` are ignored as timer noise. Each
+    entry is (case, baseline seconds, current seconds).
+    """
+    regressions = []
+    for case, seconds in results.items():
+        before = baseline.get(case)
+        if before is None:
+            continue
+        if seconds > before * (1 + threshold) and seconds - before > min_seconds:
+            regressions.append((case, before, seconds))
+    return regressions
+
+def build_parser():
+    """Build the command-line argument parser."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the vignette pipeline on synthetic images. Runs offline without the GUI."
+    )
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma-separated image sizes in megapixels (default %(default)s)")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS),
+                        help="comma-separated file formats (default %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the median is kept (default 3)")
+    parser.add_argument("--no-reference", action="store_true",
+                        help="skip timing the original create_circular_mask")
+    parser.add_argument("--output", help="write the results JSON to this file instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="slowdown over the baseline that counts as a regression (default 0.15)")
+    return parser
+
+def main(argv=None):
+    """Run the benchmarks and return 1 if any case regressed against the baseline."""
+    args = build_parser().parse_args(argv)
+    sizes = [float(s) for s in args.sizes.split(",") if s]
+    formats = [f.strip().lower().lstrip(".") for f in args.formats.split(",") if f]
+    # The inputs are our own synthetic images, so large --sizes are allowed
+    allow_large_images()
+
+    log = lambda message: print(message, file=sys.stderr)
+    results = run_benchmarks(sizes, formats, max(1, args.repeat), not args.no_reference, log)
+    report = {'environment': environment(), 'repeat': args.repeat, 'results': results}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        report['baseline'] = {'file': args.baseline, 'environment': baseline.get('environment')}
+        report['regressions'] = [
+            {'case': case, 'baseline': before, 'current': seconds, 'ratio': round(seconds / before, 3)}
+            for case, before, seconds in regressions
+        ]
+        for case, before, seconds in regressions:
+            log(f"REGRESSION {case}: {before * 1000:.1f} ms -> {seconds * 1000:.1f} ms")
+        exit_code = 1 if regressions else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+class ByteLRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values.
+
+    ``size_of(value)`` gives a value's size in bytes. Least recently used
+    entries are evicted once the stored values exceed ``max_bytes``; a
+    value larger than the whole cap is returned but never stored.
+    """
+    def __init__(self, size_of, max_bytes=256 * 1024 * 1024):
+        self.size_of = size_of
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """Return the value for ``key``, calling ``build()`` outside the lock on a miss."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = build()
+        self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        """Insert a value and evict old entries until under the byte cap."""
+        value_bytes = self.size_of(value)
+        if value_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.current_bytes += value_bytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= self.size_of(evicted)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
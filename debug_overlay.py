@@ -0,0 +1,238 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from cache import ByteLRUCache
+
+# Tried in order; the first that loads is used for every overlay
+FONT_CANDIDATES = {
+    False: ("arial.ttf", "C:/Windows/Fonts/arial.ttf"),
+    True: ("arialbd.ttf", "C:/Windows/Fonts/arialbd.ttf"),
+}
+
+# Panel darkening as an alpha over black: 255 - 170 leaves a third of the image
+PANEL_ALPHA = 170
+
+@lru_cache(maxsize=None)
+def _font_file(bold):
+    """Return the first loadable font file for ``bold``, or None to use PIL's default."""
+    for path in FONT_CANDIDATES[bold]:
+        try:
+            ImageFont.truetype(path, 12)
+            return path
+        except OSError:
+            continue
+    return None
+
+@lru_cache(maxsize=32)
+def load_font(size, bold=False):
+    """Load a font once per (size, bold) for the life of the process."""
+    path = _font_file(bold)
+    if path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
+
+def render_overlay(size, vignette_strength, diagonal_radius):
+    """Draw the debug overlay on a transparent RGBA layer of ``size``.
+
+    The rings mark the clear zone and the 25/50/75/100% fade distances;
+    the panel in the top left lists the geometry and a legend over a
+    darkened background.
+    """
+    width, height = size
+    layer = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+
+    center_x = (width - 1) / 2.0
+    center_y = (height - 1) / 2.0
+    diagonal = math.sqrt(width**2 + height**2)
+    actual_radius = int(diagonal / diagonal_radius)
+    corner_dist = math.sqrt(center_x**2 + center_y**2)
+
+    fade_range = corner_dist - actual_radius
+    if fade_range <= 0:
+        fade_range = corner_dist * 0.3
+
+    base_size = min(width, height)
+    font_size = max(14, base_size // 35)
+    small_font_size = max(12, base_size // 40)
+    small_font = load_font(small_font_size)
+    title_font = load_font(font_size + 2, bold=True)
+
+    if actual_radius > 0:
+        bbox = [center_x - actual_radius, center_y - actual_radius, center_x + actual_radius, center_y + actual_radius]
+        draw.ellipse(bbox, outline="#00FF00", width=4)
+        label_text = f"CLEAR ZONE: {actual_radius}px"
+        text_x = center_x - 60
+        text_y = int(center_y - actual_radius - small_font_size - 5)
+        if text_y > 5:
+            draw.rectangle([text_x - 2, text_y - 1, text_x + 130, text_y + small_font_size + 1], fill="#000000")
+            draw.text((text_x, text_y), label_text, fill="#00FF00", font=small_font)
+
+    fade_thresholds = [
+        (0.25, "#FFFF00", "25% fade"),
+        (0.50, "#FF8800", "50% fade"),
+        (0.75, "#FF0000", "75% fade"),
+        (1.0, "#FF00FF", "100% fade"),
+    ]
+
+    for fade_pct, color, label in fade_thresholds:
+        norm_fade = fade_pct ** (1 / vignette_strength)
+        actual_dist = actual_radius + (norm_fade * fade_range)
+
+        if actual_dist > 0 and actual_dist < max(width, height):
+            bbox = [center_x - actual_dist, center_y - actual_dist, center_x + actual_dist, center_y + actual_dist]
+            draw.ellipse(bbox, outline=color, width=2)
+
+    crosshair_size = max(30, base_size // 20)
+    draw.line([(center_x - crosshair_size, center_y), (center_x + crosshair_size, center_y)], fill="#00FFFF", width=2)
+    draw.line([(center_x, center_y - crosshair_size), (center_x, center_y + crosshair_size)], fill="#00FFFF", width=2)
+    draw.ellipse([center_x - 4, center_y - 4, center_x + 4, center_y + 4], fill="#00FFFF")
+
+    edge_points = [(0, center_y), (width - 1, center_y), (center_x, 0), (center_x, height - 1)]
+    for ex, ey in edge_points:
+        draw.line([(center_x, center_y), (ex, ey)], fill="#00FFFF", width=1)
+
+    corner_markers = [(0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1)]
+    for cx, cy in corner_markers:
+        m = 12
+        if cx == 0:
+            draw.line([(cx, cy), (cx + m, cy)], fill="#FFFFFF", width=2)
+        else:
+            draw.line([(cx, cy), (cx - m, cy)], fill="#FFFFFF", width=2)
+        if cy == 0:
+            draw.line([(cx, cy), (cx, cy + m)], fill="#FFFFFF", width=2)
+        else:
+            draw.line([(cx, cy), (cx, cy - m)], fill="#FFFFFF", width=2)
+
+    tl_dist = int(math.sqrt((0 - center_x)**2 + (0 - center_y)**2))
+    tr_dist = int(math.sqrt((width - 1 - center_x)**2 + (0 - center_y)**2))
+    bl_dist = int(math.sqrt((0 - center_x)**2 + (height - 1 - center_y)**2))
+    br_dist = int(math.sqrt((width - 1 - center_x)**2 + (height - 1 - center_y)**2))
+
+    line_height = small_font_size + 6
+    info_lines = [
+        ("DEBUG MODE", "#FF4444", title_font),
+        ("", None, None),
+        (f"Size: {width}x{height}", "#FFFFFF", small_font),
+        (f"Diagonal: {int(diagonal)}px", "#FFFFFF", small_font),
+        ("", None, None),
+        ("Settings:", "#00FFFF", small_font),
+        (f"Strength: {vignette_strength:.1f}", "#FFFF00", small_font),
+        (f"Radius Divisor: {diagonal_radius:.1f}", "#FFFF00", small_font),
+        ("", None, None),
+        ("Zones:", "#00FFFF", small_font),
+        (f"Clear Zone: {actual_radius}px", "#00FF00", small_font),
+        (f"Fade Range: {int(fade_range)}px", "#FF8800", small_font),
+        (f"Corner Dist: {int(corner_dist)}px", "#FFFFFF", small_font),
+        ("", None, None),
+        ("Legend:", "#00FFFF", small_font),
+        ("GREEN = Clear zone edge", "#00FF00", small_font),
+        ("YELLOW = 25% darkened", "#FFFF00", small_font),
+        ("ORANGE = 50% darkened", "#FF8800", small_font),
+        ("RED = 75% darkened", "#FF0000", small_font),
+        ("MAGENTA = 100% darkened", "#FF00FF", small_font),
+        ("", None, None),
+        ("Corners:", "#00FFFF", small_font),
+        (f"TL: {tl_dist}px  TR: {tr_dist}px", "#FFFFFF", small_font),
+        (f"BL: {bl_dist}px  BR: {br_dist}px", "#FFFFFF", small_font),
+    ]
+
+    panel_width = 450
+    panel_height = len(info_lines) * line_height + 15
+    panel_x = 8
+    panel_y = 8
+
+    # Translucent black darkens the image under the panel; rings drawn there are covered
+    panel_box = [panel_x, panel_y, min(panel_x + panel_width, width) - 1, min(panel_y + panel_height, height) - 1]
+    draw.rectangle(panel_box, fill=(0, 0, 0, PANEL_ALPHA))
+    draw.rectangle([panel_x, panel_y, panel_x + panel_width, panel_y + panel_height], outline="#666666", width=1)
+    y_offset = panel_y + 8
+    for line_text, color, line_font in info_lines:
+        if line_text and color:
+            draw.text((panel_x + 8, y_offset), line_text, fill=color, font=line_font)
+        y_offset += line_height
+    return layer
+
+# Overlays are stored as tiles of this size, dropping the fully transparent ones
+TILE_SIZE = 128
+
+def _prepare_tile(tile, mode):
+    """Convert one RGBA overlay tile to (source, mask) for pasting onto a ``mode`` image."""
+    if mode == 'I;16':
+        gray = np.asarray(tile.convert('L'), dtype=np.uint32) * 257
+        return gray, np.asarray(tile.getchannel('A'), dtype=np.uint32)
+    if mode in ('RGB', 'RGBA'):
+        return tile, tile  # an RGBA paste mask uses its alpha band
+    return tile.convert(mode), tile.getchannel('A')
+
+def split_overlay(layer, mode):
+    """Cut an overlay layer into [(offset, source, mask), ...] covering only its drawn pixels.
+
+    The rings are thin, so most of the layer is transparent; pasting just
+    the tiles that hold something keeps the composite cost well below a
+    full-frame paste.
+    """
+    width, height = layer.size
+    tiles = []
+    for top in range(0, height, TILE_SIZE):
+        for left in range(0, width, TILE_SIZE):
+            tile = layer.crop((left, top, min(width, left + TILE_SIZE), min(height, top + TILE_SIZE)))
+            bbox = tile.getchannel('A').getbbox()
+            if bbox:
+                offset = (left + bbox[0], top + bbox[1])
+                tiles.append((offset,) + _prepare_tile(tile.crop(bbox), mode))
+    return tiles
+
+def _part_bytes(part):
+    if isinstance(part, np.ndarray):
+        return part.nbytes
+    return part.width * part.height * len(part.getbands())
+
+def _tiles_bytes(tiles):
+    """Bytes held by a list of overlay tiles, counting a shared source and mask once."""
+    return sum(_part_bytes(source) + (0 if mask is source else _part_bytes(mask))
+               for _, source, mask in tiles)
+
+class OverlayCache(ByteLRUCache):
+    """Bounded LRU cache of rendered debug overlays, ready to paste.
+
+    Overlays are keyed by (size, mode, strength, radius divisor) and kept
+    as tiles already converted for the image mode (see split_overlay), so
+    a hit costs only the pastes. Fonts are loaded once per process by
+    load_font.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        super().__init__(_tiles_bytes, max_bytes)
+
+    def get(self, size, mode, vignette_strength, diagonal_radius):
+        """Return the overlay tiles for a ``mode`` image of ``size``, rendering them on a miss."""
+        key = (tuple(size), mode, vignette_strength, diagonal_radius)
+        return self.get_or_build(
+            key, lambda: split_overlay(render_overlay(size, vignette_strength, diagonal_radius), mode))
+
+overlay_cache = OverlayCache()
+
+def apply_debug_overlay(img, settings):
+    """Composite the cached debug overlay for ``settings`` onto ``img`` in place."""
+    tiles = overlay_cache.get(img.size, img.mode, settings['vignette_strength'], settings['diagonal_radius'])
+    for (left, top), source, mask in tiles:
+        if img.mode == 'I;16':
+            # Masked pastes mix the bytes of 16-bit pixels; blend in numpy instead
+            box = (left, top, left + mask.shape[1], top + mask.shape[0])
+            pixels = np.asarray(img.crop(box), dtype=np.uint32)
+            blended = (pixels * (255 - mask) + source * mask + 127) // 255
+            img.paste(Image.fromarray(blended.astype(np.uint16)), box)
+        elif img.mode in ('LA', 'RGBA'):
+            # Only the colour bands take the overlay; the image keeps its own alpha
+            box = (left, top, left + mask.width, top + mask.height)
+            region = img.crop(box)
+            alpha = region.getchannel('A')
+            region.paste(source, (0, 0), mask)
+            region.putalpha(alpha)
+            img.paste(region, box)
+        else:
+            img.paste(source, (left, top), mask)
+    return img
@@ -0,0 +1,167 @@
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+import logging
+
+# Per-image stages, in pipeline order
+STAGES = ('decode', 'mask', 'composite', 'overlay', 'encode', 'write', 'total', 'peak_memory')
+
+# Stages whose samples are bytes rather than seconds: (unit, scale)
+STAGE_UNITS = {'peak_memory': ('MB', 1e-6), 'batch_peak_memory': ('MB', 1e-6)}
+
+def timing_row(stage, seconds):
+    """Build one (stage, seconds) sample.
+
+    Worker processes return lists of these to the parent, which adds them
+    to its collector, so samples never need shared memory.
+    """
+    return (stage, seconds)
+
+def _percentile(ordered, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+class MetricsCollector:
+    """Thread-safe store of per-stage timing samples for one process.
+
+    Samples are seconds measured with time.perf_counter. ``persist``
+    appends the samples recorded since the last call to a CSV file
+    without reading it back, so the log can grow without slowing runs.
+    """
+    CSV_HEADER = ('timestamp', 'stage', 'seconds')
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._unsaved = []
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        """Add one sample."""
+        self.extend([(stage, seconds)])
+
+    def extend(self, rows):
+        """Add (stage, seconds) samples, e.g. those returned by a worker."""
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            for stage, seconds in rows:
+                self._samples[stage].append(seconds)
+                self._unsaved.append((timestamp, stage, f"{seconds:.6f}"))
+
+    def clear(self):
+        """Drop all samples, including any not yet persisted."""
+        with self._lock:
+            self._samples.clear()
+            self._unsaved.clear()
+
+    def __bool__(self):
+        with self._lock:
+            return bool(self._samples)
+
+    def summary(self):
+        """Return {stage: {count, total, p50, p95, max}}, known stages first."""
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+        order = [s for s in STAGES if s in samples] + sorted(s for s in samples if s not in STAGES)
+        return {
+            stage: {
+                'count': len(samples[stage]),
+                'total': sum(samples[stage]),
+                'p50': _percentile(samples[stage], 50),
+                'p95': _percentile(samples[stage], 95),
+                'max': samples[stage][-1],
+            }
+            for stage in order
+        }
+
+    def format_summary(self):
+        """Return the summary as a small text table, times in milliseconds."""
+        lines = [f"{'stage':<20}{'count':>7}{'p50':>10}{'p95':>10}{'max':>10}  unit"]
+        for stage, row in self.summary().items():
+            unit, scale = STAGE_UNITS.get(stage, ('ms', 1000))
+            lines.append(f"{stage:<20}{row['count']:>7}{row['p50'] * scale:>10.1f}"
+                         f"{row['p95'] * scale:>10.1f}{row['max'] * scale:>10.1f}  {unit}")
+        return "\n".join(lines)
+
+    def persist(self, csv_path):
+        """Append the samples recorded since the last persist to ``csv_path``."""
+        with self._lock:
+            rows, self._unsaved = self._unsaved, []
+        if not rows:
+            return
+        import csv
+        new_file = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+        try:
+            with open(csv_path, mode='a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(self.CSV_HEADER)
+                writer.writerows(rows)
+        except OSError as e:
+            logging.error(f"Error writing metrics CSV: {e}")
+
+collector = MetricsCollector()
+
+def current_rss():
+    """Return this process's resident set size in bytes, or None if unknown."""
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                    'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage',
+                    'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class MemorySampler:
+    """Track the peak resident memory of this process while a block runs.
+
+    A background thread samples current_rss every ``interval`` seconds;
+    ``peak`` is the highest reading above the one taken on entry, in
+    bytes. It covers allocations tracemalloc cannot see, such as PIL's
+    image buffers. ``peak`` stays None where RSS cannot be read.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._start = current_rss()
+        if self._start is not None:
+            self._highest = self._start
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None and rss > self._highest:
+                self._highest = rss
+
+    def __exit__(self, *exc_info):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            rss = current_rss()
+            self.peak = max(self._highest, rss or 0) - self._start
+        return False
@@ -0,0 +1,105 @@
+import os
+import queue
+import threading
+import time
+
+from PIL import Image
+
+from vignette import OUTPUT_FOLDERS, apply_vignette, decode_image, encodable, fit_size, iter_images
+
+# Long edge of the preview in pixels
+PREVIEW_SIZE = 400
+
+def load_preview_image(full_path, max_size=PREVIEW_SIZE):
+    """Decode ``full_path`` at roughly ``max_size`` for previewing.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale (draft mode) and other
+    formats shrunk by a whole factor with reduce() before the final
+    resize, so even a 50 MP source costs little more than its file read.
+    The result is 8-bit RGB or L, ready to display.
+    """
+    img = encodable(decode_image(full_path, max_size), 'JPEG')
+    factor = max(img.size) // max_size
+    if factor > 1:
+        img = img.reduce(factor)
+    target = fit_size(img.size, max_size)
+    if target != img.size:
+        img = img.resize(target, Image.BILINEAR)
+    return img
+
+def sample_image(path):
+    """Return ``path`` itself if it is a file, else the first image in the folder, or None."""
+    if not os.path.isdir(path):
+        return path
+    name = next(iter_images(path, skip_dirs=OUTPUT_FOLDERS), None)
+    return os.path.join(path, *name.split('/')) if name else None
+
+class PreviewRenderer:
+    """Render vignette previews of one sample image on a background thread.
+
+    load and render only record the newest request and return at once;
+    requests that arrive while a render is running replace each other, so
+    a burst of setting changes costs one render, not one per change.
+    Results are put on ``results`` as ('preview', image, seconds) or
+    ('error', message) for the caller's thread to pick up.
+    """
+    def __init__(self, max_size=PREVIEW_SIZE):
+        self.max_size = max_size
+        self.results = queue.Queue()
+        self._base = None
+        self._path = None
+        self._settings = None
+        self._closed = False
+        self._wake = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def load(self, path):
+        """Use ``path`` (an image, or a folder's first image) as the sample, re-rendering with the last settings."""
+        with self._wake:
+            self._path = path
+            self._wake.notify()
+
+    def render(self, settings):
+        """Render the sample with ``settings`` (a make_settings dict) once the thread is free."""
+        with self._wake:
+            self._settings = settings
+            self._wake.notify()
+
+    def close(self):
+        """Stop the render thread after any render in progress."""
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+
+    def _run(self):
+        settings = None
+        while True:
+            with self._wake:
+                while not self._closed and self._path is None and self._settings is None:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                path, self._path = self._path, None
+                settings = self._settings or settings
+                self._settings = None
+
+            if path is not None:
+                self._base = None
+                try:
+                    full_path = sample_image(path)
+                    if full_path is None:
+                        self.results.put(('error', "No images to preview"))
+                    else:
+                        self._base = load_preview_image(full_path, self.max_size)
+                except Exception as e:
+                    self.results.put(('error', f"Cannot preview {path}: {e}"))
+            if self._base is None or settings is None:
+                continue
+            start_time = time.perf_counter()
+            try:
+                img, _ = apply_vignette(self._base.copy(), settings)
+            except Exception as e:
+                self.results.put(('error', str(e)))
+                continue
+            self.results.put(('preview', img, time.perf_counter() - start_time))
@@ -0,0 +1,11 @@
+import json
+
+import pytest
+
+from vignette_cli import main
+
+@pytest.mark.parametrize("argv", [["--color", "zzz"], ["--color", "#12"], ["--radius", "0"], ["--radius", "-2"]])
+def test_bad_settings_are_an_error_event(tmp_path, capsys, argv):
+    assert main([str(tmp_path)] + argv) == 2
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [event['event'] for event in events] == ['error']
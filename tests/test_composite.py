@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageChops
+
+from vignette import _luminance, _vignette_geometry, blend_color, create_radial_mask, make_settings
+
+SIZES = [(640, 480), (333, 517)]
+COLORS = [(0, 0, 0), (200, 40, 90)]
+
+def random_image(mode, size, seed=0):
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], bands), dtype=np.uint8)
+    return Image.fromarray(pixels[:, :, 0] if bands == 1 else pixels, mode)
+
+def reference(img, coverage, color):
+    """The original compositing: a solid background and Image.composite."""
+    fill = (_luminance(color),) if img.mode in ('L', 'LA') else color
+    if img.mode in ('LA', 'RGBA'):
+        fill += (255,)
+    background = Image.new(img.mode, img.size, fill if len(fill) > 1 else fill[0])
+    return Image.composite(img, background, ImageChops.invert(coverage))
+
+def coverage_for(size, strength):
+    radius, strength = _vignette_geometry(size, make_settings(vignette_strength=strength))
+    return ImageChops.invert(create_radial_mask(size, radius, strength))
+
+@pytest.mark.parametrize("mode", ['L', 'RGB'])
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("strength", [0.5, 2.5, 8.0])
+@pytest.mark.parametrize("color", COLORS)
+def test_blend_color_is_bit_exact_with_composite(mode, size, strength, color):
+    img = random_image(mode, size)
+    coverage = coverage_for(size, strength)
+    expected = reference(img, coverage, color)
+    assert np.array_equal(np.asarray(blend_color(img, coverage, color)), np.asarray(expected))
+
+@pytest.mark.parametrize("mode", ['LA', 'RGBA'])
+@pytest.mark.parametrize("color", COLORS)
+def test_blend_color_keeps_alpha(mode, color):
+    size = SIZES[0]
+    img = random_image(mode, size)
+    alpha = np.asarray(img.getchannel('A')).copy()
+    coverage = coverage_for(size, 2.5)
+    expected = reference(img, coverage, color)
+    result = blend_color(img, coverage, color)
+    assert np.array_equal(np.asarray(result.getchannel('A')), alpha)
+    assert np.array_equal(np.asarray(result)[..., :-1], np.asarray(expected)[..., :-1])
+
+@pytest.mark.parametrize("mode", ['L', 'RGB', 'RGBA'])
+def test_blend_color_box_matches_full_frame(mode):
+    size = SIZES[1]
+    coverage = coverage_for(size, 2.5)
+    full = blend_color(random_image(mode, size), coverage, COLORS[1])
+    banded = random_image(mode, size)
+    for top in range(0, size[1], 100):
+        box = (0, top, size[0], min(size[1], top + 100))
+        blend_color(banded, coverage.crop(box), COLORS[1], box)
+    assert np.array_equal(np.asarray(banded), np.asarray(full))
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from vignette import (_vignette_geometry, create_circular_mask, create_radial_mask, create_scaled_mask,
+                      make_settings)
+
+SIZES = [(640, 480), (333, 517), (1201, 97)]
+STRENGTHS = [0.5, 2.5, 8.0]
+
+def mask_args(size, strength, diagonal_radius=4.0):
+    settings = make_settings(vignette_strength=strength, diagonal_radius=diagonal_radius)
+    return _vignette_geometry(size, settings)
+
+def levels(mask):
+    return np.asarray(mask, dtype=np.int16)
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("strength", STRENGTHS)
+@pytest.mark.parametrize("diagonal_radius", [1.5, 4.0])
+def test_radial_mask_matches_circular_mask(size, strength, diagonal_radius):
+    radius, strength = mask_args(size, strength, diagonal_radius)
+    reference = create_circular_mask(size, radius, strength)
+    mask = create_radial_mask(size, radius, strength)
+    assert mask.size == reference.size
+    assert np.max(np.abs(levels(mask) - levels(reference))) <= 1
+
+@pytest.mark.parametrize("size", [(800, 600), (1999, 1333), (1600, 2400)])
+@pytest.mark.parametrize("strength", STRENGTHS)
+@pytest.mark.parametrize("tolerance", [2, 4])
+def test_scaled_mask_stays_within_tolerance(size, strength, tolerance):
+    radius, strength = mask_args(size, strength)
+    reference = create_circular_mask(size, radius, strength)
+    mask = create_scaled_mask(size, radius, strength, tolerance)
+    assert mask.size == reference.size
+    assert np.max(np.abs(levels(mask) - levels(reference))) <= tolerance
+
+def test_scaled_mask_without_tolerance_is_the_radial_mask():
+    size = (1999, 1333)
+    radius, strength = mask_args(size, 2.5)
+    assert np.array_equal(levels(create_scaled_mask(size, radius, strength, 0)),
+                          levels(create_radial_mask(size, radius, strength)))
@@ -0,0 +1,34 @@
+import pytest
+from PIL import Image
+
+from vignette import make_settings, process_image
+
+# TIFF readers keep EXIF tags among the image tags rather than as an info block
+SOURCE_FORMATS = ['jpg', 'png', 'webp']
+OUTPUT_FORMATS = ['jpg', 'png', 'webp', 'tif']
+
+def exif_source(tmp_path, ext):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotated 90 degrees
+    exif[0x010F] = "TestCam"  # Make
+    path = tmp_path / f"source.{ext}"
+    Image.new('RGB', (64, 48), (120, 90, 60)).save(path, exif=exif)
+    return path
+
+@pytest.mark.parametrize("source_ext", SOURCE_FORMATS)
+@pytest.mark.parametrize("output_ext", OUTPUT_FORMATS)
+def test_exif_survives_format_changes(tmp_path, source_ext, output_ext):
+    source = exif_source(tmp_path, source_ext)
+    output = tmp_path / f"out.{output_ext}"
+    process_image(str(source), str(output), make_settings(output_format=f".{output_ext}"))
+    with Image.open(output) as img:
+        exif = img.getexif()
+    assert exif.get(0x0112) == 6
+    assert exif.get(0x010F) == "TestCam"
+
+def test_strip_metadata_drops_exif(tmp_path):
+    source = exif_source(tmp_path, 'webp')
+    output = tmp_path / "out.jpg"
+    process_image(str(source), str(output), make_settings(output_format='.jpg', keep_metadata=False))
+    with Image.open(output) as img:
+        assert not img.getexif()
@@ -0,0 +1,71 @@
+import json
+import threading
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+
+import pytest
+from PIL import Image
+
+import vignette_server
+from vignette_server import Client, make_server
+
+@pytest.fixture
+def server():
+    server = make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.jobs.close()
+
+@pytest.fixture
+def client(server):
+    return Client(f"http://127.0.0.1:{server.server_address[1]}")
+
+@pytest.fixture
+def folder(tmp_path):
+    for i in range(3):
+        Image.new('RGB', (160, 120), (40 * i, 90, 150)).save(tmp_path / f"{i}.png")
+    return tmp_path
+
+def test_submit_and_wait(client, folder):
+    job = client.submit(str(folder), settings={'vignette_strength': 3.0}, resume=False)
+    assert job['status'] in ('queued', 'running')
+    job = client.wait(job['id'], timeout=60)
+    assert job['status'] == 'done'
+    assert job['summary']['processed'] == 3
+    assert job['summary']['failed'] == 0
+    assert job['done'] == job['total'] == 3
+    assert sorted(p.name for p in (folder / 'processed').glob('*.png')) == ['0.png', '1.png', '2.png']
+    assert client.health()['jobs'] == {'done': 1}
+
+def test_cancel_queued_job(client, folder, monkeypatch):
+    release = threading.Event()
+    process_folder = vignette_server.process_folder
+
+    def blocked_process_folder(*args, **kwargs):
+        release.wait(30)
+        return process_folder(*args, **kwargs)
+
+    # Hold the runner on the first job so the second one is still queued
+    monkeypatch.setattr(vignette_server, 'process_folder', blocked_process_folder)
+    first = client.submit(str(folder), resume=False)
+    second = client.submit(str(folder), resume=False)
+    assert client.cancel(second['id'])['status'] == 'cancelled'
+    release.set()
+    assert client.wait(first['id'], timeout=60)['status'] == 'done'
+    assert client.job(second['id'])['status'] == 'cancelled'
+    with pytest.raises(ValueError, match="Not found"):
+        client.cancel('missing')
+
+@pytest.mark.parametrize("spec", [{}, {'path': '/no/such/folder'}, {'path': '.', 'step': 0},
+                                  {'path': '.', 'settings': {'vignette_strength': 'strong'}}])
+def test_bad_spec_is_rejected(client, spec):
+    req = urlrequest.Request(client.url + '/jobs', data=json.dumps(spec).encode(), method='POST',
+                             headers={'Content-Type': 'application/json'})
+    with pytest.raises(HTTPError) as excinfo:
+        urlrequest.urlopen(req)
+    assert excinfo.value.code == 400
+    assert json.load(excinfo.value)['error']
+    assert client.health()['jobs'] == {}
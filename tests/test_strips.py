@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from vignette import apply_vignette, apply_vignette_strips, make_settings
+
+def random_image(mode, size, seed=0):
+    rng = np.random.default_rng(seed)
+    if mode == 'I;16':
+        return Image.fromarray(rng.integers(0, 65536, (size[1], size[0]), dtype=np.uint16))
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    pixels = rng.integers(0, 256, (size[1], size[0], bands), dtype=np.uint8)
+    return Image.fromarray(pixels[:, :, 0] if bands == 1 else pixels, mode)
+
+@pytest.mark.parametrize("mode", ['L', 'LA', 'RGB', 'RGBA', 'I;16'])
+@pytest.mark.parametrize("size", [(640, 480), (333, 517)])
+@pytest.mark.parametrize("strength", [0.5, 2.5, 8.0])
+def test_strips_match_full_frame(mode, size, strength):
+    settings = make_settings(vignette_strength=strength, color=(30, 60, 200), strip_rows=97)
+    full, _ = apply_vignette(random_image(mode, size), settings)
+    strips, _ = apply_vignette_strips(random_image(mode, size), settings)
+    assert strips.mode == full.mode
+    assert np.array_equal(np.asarray(strips), np.asarray(full))
+
+def test_large_images_take_the_strip_path():
+    size = (640, 480)
+    full, _ = apply_vignette(random_image('RGB', size), make_settings())
+    strips, _ = apply_vignette(random_image('RGB', size), make_settings(strip_threshold_mp=0.1, strip_rows=64))
+    assert np.array_equal(np.asarray(strips), np.asarray(full))
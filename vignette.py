@@ -0,0 +1,1783 @@
+from PIL import Image, ImageChops, ImageFilter, ImageSequence, TiffImagePlugin
+import numpy as np
+import math
+import os
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor, wait
+import time
+import logging
+import json
+import hashlib
+import itertools
+import posixpath
+import tarfile
+import zipfile
+import zlib
+from collections import deque
+from cache import ByteLRUCache
+from metrics import MemorySampler, collector, timing_row
+from debug_overlay import apply_debug_overlay
+from io import BytesIO
+
+# Panoramas and scans run to several hundred megapixels; PIL's default
+# decompression-bomb guard refuses anything past ~179 MP
+LARGE_IMAGE_PIXELS = 1_000_000_000
+
+def allow_large_images(max_pixels=LARGE_IMAGE_PIXELS):
+    """Raise PIL's decompression-bomb limit to ``max_pixels`` in this process.
+
+    PIL warns about images over the limit and refuses those over twice it.
+    Only for trusted local input: the guard is what stops a small crafted
+    file from decoding to gigabytes, so the job server, which opens paths
+    and archives from clients, keeps PIL's default. run_pool passes the
+    limit on to the worker processes it starts.
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+def hex_to_rgb(hex_color):
+    """Convert hex color to RGB tuple, raising ValueError if it is not #RRGGBB."""
+    hex_color = hex_color.lstrip('#')
+    try:
+        if len(hex_color) != 6:
+            raise ValueError
+        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    except ValueError:
+        raise ValueError(f"Invalid color: #{hex_color}") from None
+
+def _fade_range(size, radius, vignette_strength):
+    """Return the width in pixels of the fade band outside the clear zone."""
+    width, height = size
+    corner_dist = math.hypot((width - 1) * 0.5, (height - 1) * 0.5)
+
+    # FIX: When vignette_strength is high, reduce fade_range dramatically
+    # This creates a sharper edge at high strength values
+    if vignette_strength >= 5.0:
+        # At strength 10, fade_range becomes very small (sharp edge)
+        strength_factor = (10.0 - vignette_strength) / 5.0  # 1.0 at strength=5, 0.0 at strength=10
+        strength_factor = max(0.05, strength_factor)  # Minimum 5% fade range
+        fade_range = (corner_dist - radius) * strength_factor
+    else:
+        fade_range = corner_dist - radius
+
+    if fade_range <= 0:
+        fade_range = corner_dist * 0.3
+    return fade_range
+
+def _mask_blur(fade_range, vignette_strength):
+    """Return the Gaussian blur radius applied to the mask, or 0 for none."""
+    # Reduce blur for high strength values to maintain sharp edge
+    blur_amount = max(1, int(fade_range // 25))
+    if blur_amount > 1 and vignette_strength < 8.0:
+        return blur_amount
+    return 0
+
+def create_circular_mask(size, radius, vignette_strength):
+    """Create circular vignette mask with optimized NumPy operations."""
+    width, height = size
+    center_x = (width - 1) * 0.5
+    center_y = (height - 1) * 0.5
+
+    # Use meshgrid with float32 for faster computation
+    x = np.arange(width, dtype=np.float32)
+    y = np.arange(height, dtype=np.float32)
+    X, Y = np.meshgrid(x, y)
+
+    # Calculate distance from center using hypot (faster than manual sqrt)
+    X -= center_x
+    Y -= center_y
+    dist = np.hypot(X, Y)
+
+    fade_range = _fade_range(size, radius, vignette_strength)
+
+    # Vectorized mask calculation - minimize intermediate arrays
+    # Compute (dist - radius), clamp to [0, fade_range], normalize, apply power
+    np.maximum(dist, radius, out=dist)  # dist = max(dist, radius)
+    dist -= radius  # dist = dist_beyond_radius
+    dist *= (1.0 / fade_range)  # normalize
+    np.minimum(dist, 1.0, out=dist)  # clamp to 1.0
+    
+    # Apply vignette strength and convert to mask
+    np.power(dist, vignette_strength, out=dist)
+    dist *= -255.0
+    dist += 255.0
+    mask = dist.astype(np.uint8)
+
+    # Create image from array
+    mask_image = Image.fromarray(mask, mode='L')
+
+    # Single Gaussian blur pass (faster than double box blur)
+    blur_amount = _mask_blur(fade_range, vignette_strength)
+    if blur_amount:
+        mask_image = mask_image.filter(ImageFilter.GaussianBlur(blur_amount))
+
+    return mask_image
+
+def _fade_profile(radius, fade_range, vignette_strength):
+    """Tabulate the fade profile as one distance threshold per mask level.
+
+    Entry ``k`` is the largest squared doubled distance from the centre at
+    which the mask is still at least ``255 - k``, so the table is ascending
+    and a pixel's level is 255 minus the number of thresholds below it.
+    """
+    levels = np.arange(255, 0, -1, dtype=np.float64)
+    # clamp(dist - radius, 0, fade) / fade ** strength <= 1 - level / 255
+    normalized = np.power(1.0 - levels / 255.0, 1.0 / vignette_strength)
+    thresholds = 2.0 * (radius + fade_range * normalized)
+    return thresholds * thresholds
+
+def _radial_rows(size, radius, vignette_strength, top, bottom):
+    """Return rows ``top`` to ``bottom`` of the unblurred mask as a uint8 array."""
+    width, height = size
+    fade_range = _fade_range(size, radius, vignette_strength)
+    thresholds = _fade_profile(radius, fade_range, vignette_strength)
+
+    # Doubled offsets from the centre are integers for odd and even sizes
+    half_w = width - width // 2
+    dx2 = np.arange(width - 2 * half_w + 1, width, 2, dtype=np.int64) ** 2
+    dy2 = np.arange(2 * top - height + 1, 2 * bottom - height + 1, 2, dtype=np.int64) ** 2
+
+    # Distance grows along each half row, so each level covers one run
+    bounds = np.searchsorted(dx2, thresholds[None, :] - dy2[:, None], side='right')
+    run_lengths = np.diff(bounds, axis=1, prepend=0, append=half_w)
+    levels = np.tile(np.arange(255, -1, -1, dtype=np.uint8), bottom - top)
+    half = np.repeat(levels, run_lengths.ravel()).reshape(bottom - top, half_w)
+
+    rows = np.empty((bottom - top, width), dtype=np.uint8)
+    rows[:, width // 2:] = half
+    rows[:, :width // 2] = half[:, ::-1][:, :width // 2]
+    return rows
+
+def _radial_region(size, radius, vignette_strength, box):
+    """Return the unblurred mask inside ``box`` (left, top, right, bottom) as a uint8 array."""
+    width, height = size
+    left, top, right, bottom = box
+    if left == 0 and right == width:
+        return _radial_rows(size, radius, vignette_strength, top, bottom)
+
+    fade_range = _fade_range(size, radius, vignette_strength)
+    thresholds = _fade_profile(radius, fade_range, vignette_strength)
+    dx2 = np.arange(2 * left - width + 1, 2 * right - width + 1, 2, dtype=np.int64) ** 2
+    dy2 = np.arange(2 * top - height + 1, 2 * bottom - height + 1, 2, dtype=np.int64) ** 2
+    below = np.searchsorted(thresholds, dx2[None, :] + dy2[:, None], side='left')
+    return (255 - below).astype(np.uint8)
+
+def _blur_margin(blur_amount):
+    """Pixels of context a region needs for its blur to match a full-frame blur."""
+    # GaussianBlur runs three box passes of about blur_amount + 1 pixels each
+    return 3 * (blur_amount + 1) + 1 if blur_amount else 0
+
+def _blurred_region(size, radius, vignette_strength, box):
+    """Return the finished mask inside ``box`` as an L image, identical to a full-frame build."""
+    width, height = size
+    left, top, right, bottom = box
+    blur_amount = _mask_blur(_fade_range(size, radius, vignette_strength), vignette_strength)
+    margin = _blur_margin(blur_amount)
+    outer = (max(0, left - margin), max(0, top - margin), min(width, right + margin), min(height, bottom + margin))
+
+    region = Image.fromarray(_radial_region(size, radius, vignette_strength, outer), mode='L')
+    if blur_amount:
+        region = region.filter(ImageFilter.GaussianBlur(blur_amount))
+        region = region.crop((left - outer[0], top - outer[1], right - outer[0], bottom - outer[1]))
+    return region
+
+def create_radial_mask(size, radius, vignette_strength):
+    """Create the vignette mask from a radial lookup table and one quadrant.
+
+    Matches create_circular_mask within one level, but never builds a
+    float W x H distance array: the profile is evaluated once per level,
+    each quadrant row is expanded from its level boundaries, and the
+    bottom half is mirrored into the top.
+    """
+    width, height = size
+    mask = np.empty((height, width), dtype=np.uint8)
+    mask[height // 2:] = _radial_rows(size, radius, vignette_strength, height // 2, height)
+    mask[:height // 2] = mask[height // 2:][::-1][:height // 2]
+
+    mask_image = Image.fromarray(mask, mode='L')
+    blur_amount = _mask_blur(_fade_range(size, radius, vignette_strength), vignette_strength)
+    if blur_amount:
+        mask_image = mask_image.filter(ImageFilter.GaussianBlur(blur_amount))
+
+    return mask_image
+
+MASK_SCALES = (16, 8, 4, 2)
+
+def _coarse_mask(size, radius, vignette_strength, scale):
+    """Build the mask and its blur on a grid ``scale`` times smaller than ``size``.
+
+    The coarse grid carries one extra sample on every side, so the
+    bilinear upsample interpolates between real samples right up to the
+    image edges instead of clamping.
+    """
+    width, height = size
+    fade_range = _fade_range(size, radius, vignette_strength)
+    blur_amount = _mask_blur(fade_range, vignette_strength)
+
+    # Coarse sample i sits at full-resolution pixel (i - 1) * scale + (scale - 1) / 2
+    small_w = -(-width // scale) + 2
+    small_h = -(-height // scale) + 2
+    offset = (scale - 1) * 0.5 - scale
+
+    # Samples past the edges repeat the edge pixel, as the full-size blur sees them
+    x = np.clip(np.arange(small_w, dtype=np.float32) * scale + offset, 0, width - 1)
+    y = np.clip(np.arange(small_h, dtype=np.float32) * scale + offset, 0, height - 1)
+    x -= (width - 1) * 0.5
+    y -= (height - 1) * 0.5
+    dist = np.hypot(x[None, :], y[:, None])
+
+    np.maximum(dist, radius, out=dist)
+    dist -= radius
+    dist *= (1.0 / fade_range)
+    np.minimum(dist, 1.0, out=dist)
+    np.power(dist, vignette_strength, out=dist)
+    dist *= -255.0
+    dist += 255.0
+    mask_image = Image.fromarray(dist.astype(np.uint8), mode='L')
+
+    if blur_amount:
+        mask_image = mask_image.filter(ImageFilter.GaussianBlur(blur_amount / scale))
+    return mask_image
+
+def _upsample_mask(coarse, scale, box):
+    """Bilinearly upsample the part of a coarse mask covering full-size ``box``."""
+    left, top, right, bottom = box
+    source = (1.0 + left / scale, 1.0 + top / scale, 1.0 + right / scale, 1.0 + bottom / scale)
+    return coarse.resize((right - left, bottom - top), Image.BILINEAR, box=source)
+
+def create_scaled_mask(size, radius, vignette_strength, tolerance):
+    """Create the vignette mask on the coarsest grid that stays within ``tolerance`` levels.
+
+    Candidate scales are checked against exact bands of the full-resolution
+    mask along the top and left edges (where the corners are steepest), a
+    quarter of the way down and through the centre. Unblurred masks have
+    hard edges and are always built at full resolution.
+    """
+    width, height = size
+    blur_amount = _mask_blur(_fade_range(size, radius, vignette_strength), vignette_strength)
+    scales = [scale for scale in MASK_SCALES if scale <= blur_amount and 4 * scale <= min(width, height)]
+    if not tolerance or tolerance <= 0 or not scales:
+        return create_radial_mask(size, radius, vignette_strength)
+
+    # Each band spans a full coarse period, so pixels between samples are covered
+    band = max(MASK_SCALES)
+    check_boxes = [(0, top, width, min(height, top + band)) for top in (0, height // 4, height // 2 - band // 2)]
+    check_boxes.append((0, 0, min(width, band), height))
+    references = [
+        np.asarray(_blurred_region(size, radius, vignette_strength, box), dtype=np.int16)
+        for box in check_boxes
+    ]
+
+    for scale in scales:
+        coarse = _coarse_mask(size, radius, vignette_strength, scale)
+        error = max(
+            np.max(np.abs(np.asarray(_upsample_mask(coarse, scale, box), dtype=np.int16) - reference))
+            for box, reference in zip(check_boxes, references)
+        )
+        # One level of headroom for the pixels the bands do not sample
+        if error + 1 <= tolerance:
+            logging.info("Mask %dx%d built at 1/%d scale (max error %d)", width, height, scale, error)
+            return _upsample_mask(coarse, scale, (0, 0, width, height))
+
+    return create_radial_mask(size, radius, vignette_strength)
+
+class MaskCache(ByteLRUCache):
+    """Bounded LRU cache of finished vignette masks.
+
+    Masks are keyed by (size, radius, strength, blur, tolerance, inverted)
+    and evicted least recently used first once the stored masks exceed
+    ``max_bytes``.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        super().__init__(lambda mask: mask.width * mask.height, max_bytes)
+
+    def get(self, size, radius, vignette_strength, tolerance=0, inverted=False):
+        """Return the mask for these settings, building it on a miss.
+
+        A non-zero ``tolerance`` (in mask levels) lets the mask be built on
+        a downscaled grid and upsampled; see create_scaled_mask. With
+        ``inverted`` the cached mask is 255 minus the vignette mask, i.e.
+        how much of the vignette color covers each pixel.
+        """
+        blur_amount = _mask_blur(_fade_range(size, radius, vignette_strength), vignette_strength)
+        key = (tuple(size), radius, vignette_strength, blur_amount, tolerance, inverted)
+
+        def build():
+            mask = create_scaled_mask(size, radius, vignette_strength, tolerance)
+            return ImageChops.invert(mask) if inverted else mask
+
+        return self.get_or_build(key, build)
+
+mask_cache = MaskCache()
+
+# Formats that store 16-bit grayscale; others get the high byte of each pixel
+SIXTEEN_BIT_FORMATS = ('PNG', 'TIFF')
+
+def encodable(img, image_format):
+    """Return ``img`` in a mode ``image_format`` can store, converting only if needed."""
+    if img.mode == 'I;16' and image_format not in SIXTEEN_BIT_FORMATS:
+        img = Image.fromarray((np.asarray(img) >> 8).astype(np.uint8))
+    if img.mode in ('LA', 'RGBA') and image_format == 'JPEG':
+        img = img.convert(img.mode[:-1])  # JPEG has no alpha channel
+    elif img.mode == 'LA' and image_format in ('BMP', 'WEBP'):
+        img = img.convert('RGBA')
+    return img
+
+# Named sets of PIL save options per format. "default" is fast to encode
+# at high quality; formats a profile leaves out use PIL's defaults.
+ENCODER_PROFILES = {
+    'default': {
+        'JPEG': {'quality': 95, 'subsampling': 0, 'optimize': False},
+        'PNG': {'compress_level': 1},
+    },
+    'fast': {
+        'JPEG': {'quality': 90, 'subsampling': 2, 'optimize': False},
+        'PNG': {'compress_level': 0},
+        'WEBP': {'quality': 80, 'method': 0},
+        'TIFF': {'compression': 'raw'},
+    },
+    'small': {
+        'JPEG': {'quality': 85, 'subsampling': 2, 'optimize': True, 'progressive': True},
+        'PNG': {'compress_level': 9, 'optimize': True},
+        'WEBP': {'quality': 75, 'method': 6},
+        'TIFF': {'compression': 'tiff_adobe_deflate'},
+    },
+}
+
+# Formats whose quality option ``settings['quality']`` overrides
+QUALITY_FORMATS = ('JPEG', 'WEBP')
+
+# Metadata PIL can write back unchanged, per format
+METADATA_FORMATS = {'JPEG': ('exif', 'icc_profile'), 'PNG': ('exif', 'icc_profile'),
+                    'WEBP': ('exif', 'icc_profile'), 'TIFF': ('exif', 'icc_profile')}
+
+def resolve_encoder(encoder):
+    """Turn a profile name or a {format: options} dict into per-format save options."""
+    if isinstance(encoder, str):
+        if encoder not in ENCODER_PROFILES:
+            raise ValueError(f"Unknown encoder profile: {encoder}")
+        encoder = ENCODER_PROFILES[encoder]
+    return {image_format.upper(): dict(options) for image_format, options in encoder.items()}
+
+def encode_options(image_format, settings=None):
+    """Return the save options for ``image_format`` under ``settings``.
+
+    Without settings the "default" profile is used. ``settings['quality']``
+    overrides the profile's quality for JPEG and WebP.
+    """
+    encoder = settings['encoder'] if settings else ENCODER_PROFILES['default']
+    options = dict(encoder.get(image_format, {}))
+    if settings and settings['quality'] and image_format in QUALITY_FORMATS:
+        options['quality'] = settings['quality']
+    return options
+
+# Header of an EXIF block as JPEG stores it; the PNG and WebP writers drop it themselves
+EXIF_HEADER = b'Exif\x00\x00'
+
+def image_metadata(img, image_format):
+    """Return the EXIF and ICC blocks of ``img`` that ``image_format`` can carry, as raw bytes.
+
+    The blocks are passed to the encoder as they were read, so orientation,
+    camera data and the color profile survive unchanged. WebP stores EXIF
+    without the header JPEG needs, so a missing header is put back.
+    """
+    metadata = {key: img.info[key] for key in METADATA_FORMATS.get(image_format, ()) if img.info.get(key)}
+    exif = metadata.get('exif')
+    if exif is not None and not exif.startswith(EXIF_HEADER):
+        metadata['exif'] = EXIF_HEADER + exif
+    return metadata
+
+def _encode_to(fp, result, save_path, settings=None):
+    """Encode ``result`` into ``fp`` (a path or file) in the format of ``save_path``."""
+    ext = os.path.splitext(save_path)[1].lower()
+    image_format = Image.registered_extensions()[ext]
+    options = encode_options(image_format, settings)
+    if isinstance(result, AnimatedResult):
+        if ext in ('.gif', '.tif', '.tiff', '.webp'):
+            result.save(fp, image_format, options)
+            return
+        result = result.first  # single-frame formats keep the first frame
+    if settings is None or settings['keep_metadata']:
+        options.update(image_metadata(result, image_format))
+    encodable(result, image_format).save(fp, image_format, **options)
+
+def encode_image(result, save_path, settings=None):
+    """Encode a processed image for the format of ``save_path`` and return the bytes.
+
+    The save options come from the encoder profile in ``settings`` (see
+    encode_options); EXIF and ICC data read from the source are copied
+    unless ``settings['keep_metadata']`` is off.
+    """
+    buffer = BytesIO()
+    _encode_to(buffer, result, save_path, settings)
+    return buffer.getbuffer()
+
+def write_file(data, save_path):
+    """Write encoded image bytes to ``save_path``."""
+    with open(save_path, 'wb') as f:
+        f.write(data)
+
+def _buffered(result, settings):
+    """Whether save_image may hold the encoded ``result`` in memory before writing it."""
+    if isinstance(result, AnimatedResult):
+        return False
+    return settings is None or result.width * result.height <= settings['strip_pixels']
+
+def save_image(result, save_path, rows=None, settings=None):
+    """Encode and write a processed image.
+
+    Images up to the strip threshold are encoded into memory and then
+    written, so the encode and write stages are timed apart. Larger ones
+    and frame sequences are streamed straight to the file, keeping memory
+    bounded, and the whole save counts as one encode sample. When a
+    ``rows`` list is given, the timings are appended to it.
+    """
+    start_time = time.perf_counter()
+    if not _buffered(result, settings):
+        _encode_to(save_path, result, save_path, settings)
+        if rows is not None:
+            rows.append(timing_row('encode', time.perf_counter() - start_time))
+        return
+    data = encode_image(result, save_path, settings)
+    encoded = time.perf_counter()
+    write_file(data, save_path)
+    if rows is not None:
+        rows.append(timing_row('encode', encoded - start_time))
+        rows.append(timing_row('write', time.perf_counter() - encoded))
+
+def fit_size(size, max_size):
+    """Scale ``size`` down so its long edge is at most ``max_size`` (0 means no limit)."""
+    width, height = size
+    if not max_size or max(width, height) <= max_size:
+        return size
+    scale = max_size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+# Modes images are processed in without conversion
+NATIVE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'I;16')
+
+def native_mode(img):
+    """Return the mode ``img`` is processed in.
+
+    L, LA, RGB, RGBA and 16-bit grayscale are kept as they are. Other
+    16-bit and 32-bit integer grayscale becomes I;16, palette images
+    become RGBA if they carry transparency, and anything else becomes RGB.
+    """
+    if img.mode in NATIVE_MODES:
+        return img.mode
+    if img.mode.startswith('I'):
+        return 'I;16'
+    if img.mode == 'PA' or (img.mode == 'P' and img.has_transparency_data):
+        return 'RGBA'
+    return 'RGB'
+
+def to_native(img, copy=False):
+    """Load ``img`` in its native_mode, converting only when its mode is unsupported.
+
+    An image already in a supported mode is returned itself, without the
+    copy a convert would make, unless ``copy`` is set (e.g. for frames of
+    a sequence, which the next seek overwrites).
+    """
+    mode = native_mode(img)
+    if mode != img.mode:
+        converted = img.convert(mode)
+        if img.mode in ('CMYK', 'LAB', 'HSV', 'YCbCr'):
+            # The source's color profile does not describe the converted pixels
+            converted.info.pop('icc_profile', None)
+        return converted
+    if copy:
+        return img.copy()
+    img.load()
+    return img
+
+def _decode_opened(img, max_size):
+    if max_size and img.format == 'JPEG':
+        img.draft(None, fit_size(img.size, max_size))
+    return to_native(img)
+
+def decode_image(full_path, max_size=0):
+    """Open an image file and decode it in its native mode (see native_mode).
+
+    With ``max_size``, a JPEG is decoded at the smallest 1/2, 1/4 or 1/8
+    scale that still covers that long edge (PIL's draft mode), which is
+    much faster than a full decode when only small renditions are needed.
+    """
+    with Image.open(full_path) as img:
+        return _decode_opened(img, max_size)
+
+# Formats whose extra frames are kept rather than flattened to the first
+MULTI_FRAME_FORMATS = ('GIF', 'TIFF')
+
+def open_source(full_path, max_size=0):
+    """Decode a still image like decode_image, or return a FrameSequence.
+
+    Animated GIFs and multi-page TIFFs are not decoded here; their frames
+    are streamed one at a time when the output is encoded.
+    """
+    with Image.open(full_path) as img:
+        if img.format in MULTI_FRAME_FORMATS and getattr(img, 'is_animated', False):
+            return FrameSequence(full_path, img)
+        return _decode_opened(img, max_size)
+
+class FrameSequence:
+    """The frames of an animated GIF or multi-page TIFF, read lazily.
+
+    Nothing but the header is read up front. Each render opens the file
+    again and decodes it frame by frame, so memory does not grow with the
+    number of frames; a sweep therefore re-reads the file once per
+    variant.
+    """
+    def __init__(self, full_path, img):
+        self.full_path = full_path
+        self.format = img.format
+        self.size = img.size
+        self.loop = img.info.get('loop')
+
+    def _frames(self, settings, durations, disposals):
+        with Image.open(self.full_path) as img:
+            for frame in ImageSequence.Iterator(img):
+                # Timing is read as each frame is decoded; the encoder looks up
+                # a frame's entry only after taking the frame
+                durations.append(frame.info.get('duration', 0))
+                disposals.append(getattr(img, 'disposal_method', 0))
+                frame = to_native(frame, copy=True)
+                target = fit_size(frame.size, settings['max_size'])
+                if target != frame.size:
+                    frame = frame.resize(target, Image.LANCZOS, reducing_gap=3.0)
+                # Frames share a size, so every frame after the first hits mask_cache
+                yield apply_vignette(frame, settings)
+
+    def render(self, settings):
+        """Vignette the first frame now and the rest as they are encoded.
+
+        Returns an AnimatedResult and the first frame's timing rows.
+        """
+        durations, disposals = [], []
+        frames = self._frames(settings, durations, disposals)
+        first, rows = next(frames)
+        rest = (frame for frame, _ in frames)
+        return AnimatedResult(first, rest, self.loop, durations, disposals), rows
+
+class AnimatedResult:
+    """A vignetted frame sequence, saved with save_all and streamed frames.
+
+    ``durations`` and ``disposals`` fill up as ``rest`` is consumed.
+    """
+    def __init__(self, first, rest, loop, durations, disposals):
+        self.first = first
+        self.rest = rest
+        self.loop = loop
+        self.durations = durations
+        self.disposals = disposals
+
+    @property
+    def size(self):
+        return self.first.size
+
+    def save(self, fp, image_format, encoder_options=None):
+        """Encode all frames, keeping durations, disposal and loop count."""
+        rest = (encodable(frame, image_format) for frame in self.rest)
+        if image_format == 'TIFF':
+            self._save_pages(fp, encodable(self.first, image_format), rest, encoder_options)
+            return
+        if image_format in ('GIF', 'WEBP'):
+            # One canvas size for the whole animation; TIFF pages may differ
+            rest = (frame if frame.size == self.size else frame.resize(self.size, Image.LANCZOS)
+                    for frame in rest)
+        options = dict(encoder_options or {}, save_all=True, append_images=rest)
+        if image_format in ('GIF', 'WEBP'):
+            options['duration'] = self.durations
+            if self.loop is not None:
+                options['loop'] = self.loop
+        if image_format == 'GIF':
+            options['disposal'] = self.disposals
+        encodable(self.first, image_format).save(fp, image_format, **options)
+
+    @staticmethod
+    def _save_pages(fp, first, rest, encoder_options):
+        """Write TIFF pages one at a time.
+
+        PIL's own save_all for TIFF makes a list of ``append_images`` first,
+        which would render and hold every page before writing the first.
+        """
+        with TiffImagePlugin.AppendingTiffWriter(fp, new=True) as writer:
+            for page in itertools.chain([first], rest):
+                page.encoderinfo = dict(encoder_options or {})
+                page.encoderconfig = ()
+                TiffImagePlugin._save(page, writer, '')
+                writer.newFrame()
+
+def _luminance(color):
+    """Gray level of an RGB color, with the weights PIL uses to convert RGB to L."""
+    r, g, b = color
+    return (r * 299 + g * 587 + b * 114) // 1000
+
+def _blend_16bit(img, coverage, level, box):
+    """Blend a 16-bit gray ``level`` into an I;16 image region.
+
+    PIL pastes 16-bit pixels byte by byte through a mask, which mixes the
+    high and low bytes separately, so the blend is done in numpy instead.
+    """
+    region = np.asarray(img.crop(box), dtype=np.uint32)
+    weight = np.asarray(coverage, dtype=np.uint32)
+    blended = (region * (255 - weight) + level * weight + 127) // 255
+    img.paste(Image.fromarray(blended.astype(np.uint16)), box)
+
+def blend_color(img, coverage, color, box=None):
+    """Blend a solid color into ``img`` in place, weighted by the ``coverage`` mask.
+
+    Pasting a color through a mask uses the same integer blend as
+    Image.composite, so this is bit-exact with
+    ``Image.composite(img, Image.new(img.mode, img.size, color), invert(coverage))``
+    without allocating the background or a separate output image. ``box``
+    limits the blend to the region the mask covers.
+
+    ``color`` is RGB; grayscale images get its luminance. Only the color
+    channels are blended, an alpha channel is left as it was.
+    """
+    if box is None:
+        box = (0, 0) + img.size
+    if img.mode == 'I;16':
+        _blend_16bit(img, coverage, _luminance(color) * 257, box)
+        return img
+    fill = _luminance(color) if img.mode in ('L', 'LA') else tuple(color)
+    if img.mode in ('LA', 'RGBA'):
+        # A color paste composites over the image's alpha, so blend onto an
+        # opaque copy of the region and put the original alpha back after it
+        whole = box == (0, 0) + img.size
+        region = img if whole else img.crop(box)
+        alpha = region.getchannel('A')
+        region.putalpha(255)
+        region.paste(fill + (255,) if img.mode == 'RGBA' else (fill, 255), None, coverage)
+        region.putalpha(alpha)
+        if not whole:
+            img.paste(region, box)
+        return img
+    img.paste(fill, box, coverage)
+    return img
+
+def _vignette_geometry(size, settings):
+    """Return the clear-zone radius and clamped strength for an image size."""
+    # Use hypot for faster diagonal calculation
+    diagonal = math.hypot(*size)
+    radius = int(diagonal / settings['diagonal_radius'])
+    strength = max(0.1, min(10.0, settings['vignette_strength']))
+    return radius, strength
+
+def apply_vignette_strips(img, settings):
+    """Composite the vignette band by band, building only each band's mask.
+
+    Each band's mask is blurred with enough rows of context to be
+    identical to the same rows of a full-frame mask, so the output matches
+    apply_vignette with mask_tolerance 0. Only one band of mask is alive
+    at a time, however large the image. Returns the image and the mask
+    and composite timings summed over all bands.
+    """
+    width, height = img.size
+    radius, strength = _vignette_geometry(img.size, settings)
+    strip_rows = settings['strip_rows']
+    mask_time = composite_time = 0.0
+
+    for top in range(0, height, strip_rows):
+        box = (0, top, width, min(height, top + strip_rows))
+        start_time = time.perf_counter()
+        coverage = ImageChops.invert(_blurred_region(img.size, radius, strength, box))
+        built = time.perf_counter()
+        blend_color(img, coverage, settings['color'], box)
+        mask_time += built - start_time
+        composite_time += time.perf_counter() - built
+    return img, [timing_row('mask', mask_time), timing_row('composite', composite_time)]
+
+def apply_vignette(img, settings):
+    """Composite the vignette onto a decoded image in place, in its native mode.
+
+    ``settings`` is a plain dict (vignette_strength, diagonal_radius,
+    color, mask_tolerance, strip_pixels, strip_rows) so it can be sent to
+    worker processes. Images over ``strip_pixels`` pixels go through
+    apply_vignette_strips instead of the mask cache. With
+    ``debug_overlay`` set, the cached debug overlay is composited on top.
+    Returns the result and the mask, composite (and overlay) timing rows.
+    """
+    width, height = img.size
+    if width * height > settings['strip_pixels']:
+        img, rows = apply_vignette_strips(img, settings)
+    else:
+        radius, strength = _vignette_geometry(img.size, settings)
+
+        start_time = time.perf_counter()
+        coverage = mask_cache.get((width, height), radius, strength, settings['mask_tolerance'], inverted=True)
+        built = time.perf_counter()
+        blend_color(img, coverage, settings['color'])
+        rows = [timing_row('mask', built - start_time), timing_row('composite', time.perf_counter() - built)]
+
+    if settings['debug_overlay']:
+        start_time = time.perf_counter()
+        apply_debug_overlay(img, settings)
+        rows.append(timing_row('overlay', time.perf_counter() - start_time))
+    return img, rows
+
+def process_image(full_path, save_path, settings):
+    """Apply the vignette to one image file and save the result.
+
+    Returns the per-stage timing rows for the image; the caller adds them
+    to its metrics collector, which lets the rows cross a process boundary.
+    """
+    return process_variants(full_path, [(save_path, settings)])
+
+def job_outputs(save_path, settings):
+    """Pair a job's output path(s) with settings as [(save_path, settings), ...].
+
+    ``settings`` is either one settings dict, with ``save_path`` a single
+    path, or a list of preset settings, with ``save_path`` a tuple of one
+    path per preset (see process_folder's ``presets``).
+    """
+    if isinstance(settings, dict):
+        return [(save_path, settings)]
+    return list(zip(save_path, settings))
+
+def process_variants(full_path, outputs):
+    """Decode one image once and save a vignetted variant per (save_path, settings).
+
+    Every variant but the last is made from a copy of the decoded image,
+    and variants whose size and parameters give the same mask share it
+    through mask_cache. Returns the timing rows, like process_image.
+    """
+    start_time = time.perf_counter()
+    img = open_source(full_path, decode_limit(outputs))
+    rows = [timing_row('decode', time.perf_counter() - start_time)]
+    plan = plan_variants(img.size, outputs)
+    for index, (save_path, settings, target) in enumerate(plan):
+        result, vignette_rows = render_variant(img, target, index == len(plan) - 1, settings)
+        rows.extend(vignette_rows)
+        save_image(result, save_path, rows, settings)
+    return rows
+
+def decode_limit(outputs):
+    """Return the long edge an image must be decoded at to serve ``outputs``, 0 for full size."""
+    sizes = [settings['max_size'] for _, settings in outputs]
+    return 0 if 0 in sizes else max(sizes)
+
+def plan_variants(size, outputs):
+    """Order a decoded image's outputs as (save_path, settings, target size).
+
+    Downscaled renditions come first, since they are resized from the
+    untouched decode; full-size outputs follow so the last one can be
+    vignetted in place.
+    """
+    planned = [(save_path, settings, fit_size(size, settings['max_size'])) for save_path, settings in outputs]
+    return [entry for entry in planned if entry[2] != size] + [entry for entry in planned if entry[2] == size]
+
+def render_variant(source, target, last, settings):
+    """Vignette one planned output of ``source``, returning (result, timing rows).
+
+    A FrameSequence is rendered lazily; its remaining frames are
+    vignetted while the result is encoded, so their time counts as encode.
+    """
+    if isinstance(source, FrameSequence):
+        return source.render(settings)
+    return apply_vignette(make_variant(source, target, last), settings)
+
+def make_variant(img, target, last):
+    """Return the image to vignette for one output: resized, copied, or ``img`` itself if last."""
+    if target != img.size:
+        # reducing_gap lets PIL shrink by whole factors before the Lanczos pass
+        return img.resize(target, Image.LANCZOS, reducing_gap=3.0)
+    return img if last else img.copy()
+
+def _run_job(full_path, save_path, settings):
+    """Process one image, returning (ok, timing rows, error) instead of raising.
+
+    Worker processes handle one image at a time, so the process's peak
+    memory while the image runs is recorded as its ``peak_memory`` row.
+    """
+    overall_start = time.perf_counter()
+    with MemorySampler() as sampler:
+        try:
+            rows = process_variants(full_path, job_outputs(save_path, settings))
+            error = None
+        except Exception as e:
+            rows = []
+            error = str(e)
+    rows.append(timing_row('total', time.perf_counter() - overall_start))
+    if sampler.peak is not None:
+        rows.append(timing_row('peak_memory', sampler.peak))
+    return error is None, rows, error
+
+# Bytes per pixel of PIL's in-memory storage by mode; RGB is padded to 4
+_MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2, 'LA': 4, 'RGB': 4,
+               'RGBA': 4, 'CMYK': 4, 'YCbCr': 4, 'LAB': 4, 'HSV': 4, 'I': 4, 'F': 4}
+
+# Bytes per pixel of the mode each source mode is processed in (see native_mode)
+_NATIVE_BYTES = {'L': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2, 'I': 2}
+
+def estimate_footprint(full_path, settings):
+    """Estimate the peak bytes needed to process one image, from its header only.
+
+    Counts the decoded image in its native mode, the source frame when it
+    needs converting, the mask and its blur copy (one band of it for images
+    processed in strips, whose output is streamed to disk) and otherwise
+    the encoded output, plus the working copy when ``settings`` is a list
+    of presets. Frame sequences are rendered a frame at a time, but an
+    animated GIF also counts its other frames, which the encoder holds.
+    Returns 0 if the header cannot be read; such files fail quickly
+    anyway.
+    """
+    presets = [settings] if isinstance(settings, dict) else settings
+    settings = presets[0]
+    try:
+        with Image.open(full_path) as img:
+            width, height = img.size
+            mode = img.mode
+            # PIL's GIF encoder keeps every frame until it writes the file
+            held_frames = img.n_frames - 1 if img.format == 'GIF' and getattr(img, 'is_animated', False) else 0
+    except Exception:
+        return 0
+    pixels = width * height
+    native = _NATIVE_BYTES.get(mode, 4)
+    footprint = native * pixels
+    if mode not in NATIVE_MODES:
+        footprint += _MODE_BYTES.get(mode, 4) * pixels
+    if pixels > settings['strip_pixels']:
+        footprint += 2 * width * 2 * settings['strip_rows']
+    else:
+        footprint += 2 * pixels
+        ext = os.path.splitext(full_path)[1].lower()
+        footprint += pixels if ext in ('.jpg', '.jpeg') else 3 * pixels
+    if len(presets) > 1:
+        footprint += native * pixels
+    return footprint + held_frames * 4 * pixels
+
+class MemoryBudget:
+    """Admit work only while its estimated memory fits under ``max_bytes``.
+
+    One job is always admitted when nothing else is running, so an image
+    larger than the whole budget still runs, just on its own.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._changed = threading.Condition()
+
+    def try_acquire(self, nbytes):
+        """Reserve ``nbytes`` if they fit now; return whether they were reserved."""
+        with self._changed:
+            if self.in_use and self.in_use + nbytes > self.max_bytes:
+                return False
+            self.in_use += nbytes
+            return True
+
+    def acquire(self, nbytes, should_stop):
+        """Wait until ``nbytes`` fit and reserve them; False if stopped first."""
+        with self._changed:
+            while self.in_use and self.in_use + nbytes > self.max_bytes:
+                if should_stop():
+                    return False
+                self._changed.wait(0.1)
+            self.in_use += nbytes
+            return True
+
+    def release(self, nbytes):
+        """Return a reservation made by acquire or try_acquire."""
+        with self._changed:
+            self.in_use -= nbytes
+            self._changed.notify_all()
+
+_STAGE_DONE = object()
+
+def _put_stage(stage_queue, item, should_stop):
+    """Put onto a bounded stage queue, giving up once processing is stopped."""
+    while not should_stop():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get_stage(stage_queue, should_stop):
+    """Take the next item from a stage queue, or _STAGE_DONE once stopped."""
+    while not should_stop():
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _STAGE_DONE
+
+def run_pipeline(jobs, settings, queue_depth, should_stop, budget=None, save=save_image):
+    """Process (full_path, save_path) jobs as a decode -> vignette -> save pipeline.
+
+    ``settings`` may also be a list of presets; see job_outputs. Each
+    image is then decoded once and every variant goes through the
+    vignette and save stages.
+
+    Each stage runs on its own thread and hands images to the next through
+    a queue holding at most ``queue_depth`` images, so reading the next
+    file and writing the previous one overlap with compositing while
+    memory stays capped. Yields ``(job, (ok, rows, error))`` in job order,
+    like run_pool, and winds down once ``should_stop()`` returns True.
+    An exception raised by ``jobs`` itself is re-raised after the jobs
+    before it have been yielded.
+    With a MemoryBudget, an image is only decoded once its estimated
+    footprint fits, and its reservation is held until it is saved. The
+    process's peak memory over the batch is recorded as
+    ``batch_peak_memory``. ``save(result, save_path, rows, settings)``
+    replaces save_image in the save stage, e.g. to write into an archive.
+    """
+    decoded = queue.Queue(maxsize=queue_depth)
+    composited = queue.Queue(maxsize=queue_depth)
+    finished = queue.Queue()
+
+    errors = []
+
+    def decode_stage():
+        try:
+            for job in jobs:
+                if should_stop():
+                    return
+                cost = 0
+                if budget is not None:
+                    cost = estimate_footprint(job[0], settings)
+                    if not budget.acquire(cost, should_stop):
+                        return
+                start_time = time.perf_counter()
+                try:
+                    item = (job, open_source(job[0], decode_limit(job_outputs(job[1], settings))), None)
+                except Exception as e:
+                    item = (job, None, str(e))
+                if not _put_stage(decoded, item + (time.perf_counter() - start_time, cost), should_stop):
+                    return
+        except Exception as e:
+            # A failing job source (e.g. an unreadable folder) ends the batch;
+            # the consumer re-raises it once the images before it are through
+            errors.append(e)
+        finally:
+            _put_stage(decoded, _STAGE_DONE, should_stop)
+
+    def vignette_stage():
+        try:
+            while True:
+                item = _get_stage(decoded, should_stop)
+                if item is _STAGE_DONE:
+                    break
+                job, img, error, elapsed, cost = item
+                rows = [timing_row('decode', elapsed)] if error is None else []
+                plan = plan_variants(img.size, job_outputs(job[1], settings)) if error is None else [(None, None, None)]
+                for index, (save_path, variant_settings, target) in enumerate(plan):
+                    last = index == len(plan) - 1
+                    start_time = time.perf_counter()
+                    result = None
+                    if error is None:
+                        try:
+                            result, vignette_rows = render_variant(img, target, last, variant_settings)
+                            rows.extend(vignette_rows)
+                        except Exception as e:
+                            error = str(e)
+                    elapsed += time.perf_counter() - start_time
+                    item = (job, save_path, variant_settings, result, rows, error, elapsed, cost, last or error is not None)
+                    if not _put_stage(composited, item, should_stop):
+                        return
+                    if error is not None:
+                        break
+                img = None
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put_stage(composited, _STAGE_DONE, should_stop)
+
+    def save_stage():
+        saving, job_error = 0.0, None
+        try:
+            while True:
+                item = _get_stage(composited, should_stop)
+                if item is _STAGE_DONE:
+                    break
+                job, save_path, variant_settings, result, rows, error, elapsed, cost, last = item
+                start_time = time.perf_counter()
+                if error is None:
+                    try:
+                        save(result, save_path, rows, variant_settings)
+                    except Exception as e:
+                        error = str(e)
+                result = None
+                # Variants of one image arrive together; the first error sticks
+                saving += time.perf_counter() - start_time
+                job_error = job_error or error
+                if not last:
+                    continue
+                if budget is not None:
+                    budget.release(cost)
+                rows.append(timing_row('total', elapsed + saving))
+                finished.put((job, (job_error is None, rows, job_error)))
+                saving, job_error = 0.0, None
+        finally:
+            finished.put(_STAGE_DONE)
+
+    for stage in (decode_stage, vignette_stage, save_stage):
+        threading.Thread(target=stage, daemon=True).start()
+
+    with MemorySampler() as sampler:
+        while True:
+            item = finished.get()
+            if item is _STAGE_DONE:
+                break
+            yield item
+    if sampler.peak is not None:
+        collector.record('batch_peak_memory', sampler.peak)
+    if errors:
+        raise errors[0]
+
+def run_pool(jobs, settings, workers, should_stop, budget=None, pool=None):
+    """Process jobs across a pool of worker processes.
+
+    Results are yielded in job order, like run_pipeline. Only about two
+    jobs per worker are queued at a time, so when ``should_stop()`` turns
+    True the queued jobs are cancelled and only images already being
+    processed run to completion in the background. With a MemoryBudget,
+    jobs are also held back, in order, until their estimated footprint
+    fits, so large images run with fewer neighbours than small ones.
+    A long-lived ``pool`` (ProcessPoolExecutor) can be passed in to keep
+    its workers and their mask caches warm between batches; it is left
+    running afterwards.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=allow_large_images,
+                                   initargs=(Image.MAX_IMAGE_PIXELS,))
+    pending = deque()
+    jobs = iter(jobs)
+    waiting = None  # (job, cost) that did not fit the budget yet
+    try:
+        while not should_stop():
+            while len(pending) < workers * 2:
+                if waiting is None:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    waiting = (job, estimate_footprint(job[0], settings) if budget is not None else 0)
+                job, cost = waiting
+                if budget is not None and not budget.try_acquire(cost):
+                    break
+                waiting = None
+                pending.append((job, cost, pool.submit(_run_job, job[0], job[1], settings)))
+            if not pending:
+                return
+
+            job, cost, future = pending[0]
+            done, _ = wait([future], timeout=0.1)
+            if done:
+                pending.popleft()
+                if budget is not None:
+                    budget.release(cost)
+                yield job, future.result()
+    finally:
+        if own_pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            for _, _, future in pending:
+                future.cancel()
+
+VALID_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp', '.gif'}
+
+def make_settings(vignette_strength=2.5, diagonal_radius=4.0, color="#000000", mask_tolerance=0,
+                  strip_threshold_mp=64, strip_rows=2048, max_size=0, quality=None, output_format=None,
+                  debug_overlay=False, encoder='default', keep_metadata=True):
+    """Build the settings dict used by the processing functions.
+
+    ``color`` may be a hex string or an RGB tuple. ``max_size`` limits the
+    output's long edge, so presets can describe web or thumbnail
+    renditions; ``quality`` and ``output_format`` (a file extension such
+    as "webp") choose how that output is encoded. ``debug_overlay`` draws
+    the clear zone, fade rings and a settings panel onto every image.
+    ``encoder`` is a name from ENCODER_PROFILES or a {format: save
+    options} dict; ``keep_metadata`` copies EXIF and ICC data to outputs.
+    Raises ValueError for a bad color, radius divisor or output format.
+    """
+    if float(diagonal_radius) <= 0:
+        raise ValueError(f"Radius divisor must be positive, not {diagonal_radius}")
+    if isinstance(color, str):
+        color = hex_to_rgb(color)
+    if output_format:
+        output_format = '.' + output_format.lower().lstrip('.')
+        if output_format not in VALID_EXTENSIONS:
+            raise ValueError(f"Unsupported output format: {output_format}")
+    return {
+        'vignette_strength': float(vignette_strength),
+        'diagonal_radius': float(diagonal_radius),
+        'color': tuple(color),
+        'mask_tolerance': float(mask_tolerance),
+        'strip_pixels': float(strip_threshold_mp) * 1e6,
+        'strip_rows': max(1, int(strip_rows)),
+        'max_size': max(0, int(max_size or 0)),
+        'quality': int(quality) if quality else None,
+        'format': output_format,
+        'debug_overlay': bool(debug_overlay),
+        'encoder': resolve_encoder(encoder),
+        'keep_metadata': bool(keep_metadata),
+    }
+
+# Settings that change the output pixels; strip size and the like do not
+OUTPUT_SETTINGS = ('vignette_strength', 'diagonal_radius', 'color', 'mask_tolerance', 'max_size', 'quality', 'format',
+                   'debug_overlay', 'encoder', 'keep_metadata')
+
+def settings_hash(settings):
+    """Return a short hash of the settings that affect the output image.
+
+    ``settings`` may also be a list of presets, hashed together.
+    """
+    presets = [settings] if isinstance(settings, dict) else settings
+    key = [{name: preset[name] for name in OUTPUT_SETTINGS} for preset in presets]
+    if isinstance(settings, dict):
+        key = key[0]
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+class Manifest:
+    """Record of finished images kept in the output folder.
+
+    Each entry maps an input path, relative to the source folder and with
+    forward slashes, to its size, mtime and the
+    settings hash it was processed with, so a later run can skip inputs
+    that are unchanged and already have an output. The file is rewritten
+    atomically at most every ``save_interval`` seconds and on close, so a
+    crash loses at most a few seconds of entries.
+    """
+    FILE_NAME = '.vignette_manifest.json'
+
+    def __init__(self, output_path, save_interval=2.0):
+        self.path = os.path.join(output_path, self.FILE_NAME)
+        self.save_interval = save_interval
+        self.entries = {}
+        self._dirty = False
+        self._last_save = time.monotonic()
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f).get('images', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+
+    @staticmethod
+    def _stamp(stat, settings_key):
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'settings': settings_key}
+
+    def is_current(self, name, full_path, save_path, settings_key, stat=None):
+        """Return True if the input ``name`` was already processed as is.
+
+        ``stat`` may be passed when the caller already has the file's
+        stat result, e.g. from os.scandir. ``save_path`` may be a tuple of
+        paths, one per preset, which must all exist.
+        """
+        entry = self.entries.get(name)
+        save_paths = save_path if isinstance(save_path, tuple) else (save_path,)
+        if entry is None or not all(os.path.exists(p) for p in save_paths):
+            return False
+        try:
+            return entry == self._stamp(stat or os.stat(full_path), settings_key)
+        except OSError:
+            return False
+
+    def record(self, name, full_path, settings_key):
+        """Mark the input ``name`` as processed and save if the interval has passed."""
+        try:
+            self.entries[name] = self._stamp(os.stat(full_path), settings_key)
+        except OSError:
+            return
+        self._dirty = True
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """Write the manifest if it changed, replacing the old file atomically."""
+        if not self._dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': 1, 'images': self.entries}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logging.error(f"Error saving manifest {self.path}: {e}")
+        self._last_save = time.monotonic()
+
+def _walk_images(path, recursive=False, skip_dirs=()):
+    """Yield ``(relative_path, DirEntry)`` for the image files under ``path``.
+
+    Each directory is read once with os.scandir and its entries sorted by
+    name; files come before subdirectories, so the order is stable and
+    only one directory listing is held per level. Relative paths use
+    forward slashes. Directories named in ``skip_dirs`` are not entered,
+    nor are symlinks to directories, so a link back up the tree cannot
+    loop; unreadable subdirectories are logged and skipped.
+    """
+    stack = [('', path)]
+    while stack:
+        prefix, folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            if not prefix:
+                raise
+            logging.error(f"Error reading {folder}: {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    if os.path.splitext(entry.name)[1].lower() in VALID_EXTENSIONS:
+                        yield prefix + entry.name, entry
+                elif recursive and entry.is_dir(follow_symlinks=False) and entry.name not in skip_dirs:
+                    subdirs.append((prefix + entry.name + '/', entry.path))
+            except OSError:
+                continue
+        # Reversed so the stack pops subdirectories in name order
+        stack.extend(reversed(subdirs))
+
+def iter_images(path, step=1, recursive=False, skip_dirs=()):
+    """Yield every ``step``-th image path under ``path``, relative to it.
+
+    Images are counted in the order of _walk_images, so the selection is
+    the same on every run.
+    """
+    for i, (name, _) in enumerate(_walk_images(path, recursive, skip_dirs)):
+        if i % step == 0:
+            yield name
+
+def make_presets(specs, **defaults):
+    """Build named settings for a sweep from a list of preset dicts.
+
+    Each spec has a ``name``, used as the output subfolder, plus any
+    make_settings arguments; missing ones come from ``defaults``. Returns
+    a list of (name, settings). Raises ValueError for a missing, unsafe
+    or repeated name.
+    """
+    presets = []
+    for spec in specs:
+        spec = dict(spec)
+        name = str(spec.pop('name', '')).strip()
+        if not name or name in ('.', '..') or any(sep in name for sep in ('/', '\\', ':')):
+            raise ValueError(f"Invalid preset name: {name!r}")
+        if any(name == existing for existing, _ in presets):
+            raise ValueError(f"Duplicate preset name: {name!r}")
+        presets.append((name, make_settings(**{**defaults, **spec})))
+    return presets
+
+def _prefetch(items, depth, should_stop):
+    """Iterate ``items`` on a background thread, buffering up to ``depth`` ahead.
+
+    Lets slow directory scans overlap with processing. Exceptions from
+    ``items`` are re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    errors = []
+
+    def produce():
+        try:
+            for item in items:
+                if not _put_stage(buffer, item, should_stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+        _put_stage(buffer, _STAGE_DONE, should_stop)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = _get_stage(buffer, should_stop)
+        if item is _STAGE_DONE:
+            break
+        yield item
+    if errors:
+        raise errors[0]
+
+# Never descend into output folders when scanning recursively
+OUTPUT_FOLDERS = ('processed', 'processed_debug')
+
+def _output_path(output_dir, name, settings):
+    """Return where the output for relative input ``name`` goes, honouring settings['format']."""
+    save_path = os.path.join(output_dir, *name.split('/'))
+    if settings['format']:
+        save_path = os.path.splitext(save_path)[0] + settings['format']
+    return save_path
+
+# Encoder options tried by calibrate_encoder, per format
+CALIBRATION_CANDIDATES = {
+    'JPEG': [{'quality': quality, 'subsampling': subsampling, 'optimize': False}
+             for quality in (95, 90, 85, 80, 75) for subsampling in (0, 2)],
+    'WEBP': [{'quality': quality, 'method': method} for quality in (90, 80, 70) for method in (0, 4)],
+    'PNG': [{'compress_level': level} for level in (1, 3, 6, 9)],
+    'TIFF': [{'compression': compression} for compression in ('raw', 'tiff_lzw', 'tiff_adobe_deflate')],
+}
+
+def calibrate_encoder(path, settings, target_bytes, step=1, recursive=False, sample_size=8,
+                      candidates=None, repeat=2):
+    """Choose encoder options for a batch by timing candidates on a sample of it.
+
+    Up to ``sample_size`` images, spread evenly over the ones
+    process_folder would pick, are vignetted once each and encoded with
+    every candidate for their output format (CALIBRATION_CANDIDATES by
+    default), keeping the best of ``repeat`` timings. For each format the
+    fastest candidate whose mean output size is within ``target_bytes``
+    wins; if none is, the smallest does. Returns a copy of ``settings``
+    using the winners, with ``quality`` cleared so it does not override
+    them, and a report row per candidate.
+    """
+    candidates = candidates or CALIBRATION_CANDIDATES
+    names = list(iter_images(path, step, recursive, skip_dirs=OUTPUT_FOLDERS))
+    sample = names[::max(1, len(names) // sample_size)][:sample_size]
+    totals = {}  # (format, candidate index) -> [bytes, seconds, images]
+    for name in sample:
+        image_format = Image.registered_extensions()[os.path.splitext(_output_path('', name, settings))[1].lower()]
+        if image_format not in candidates:
+            continue
+        img = decode_image(os.path.join(path, *name.split('/')), settings['max_size'])
+        img, _ = apply_vignette(make_variant(img, fit_size(img.size, settings['max_size']), True), settings)
+        metadata = image_metadata(img, image_format) if settings['keep_metadata'] else {}
+        for index, options in enumerate(candidates[image_format]):
+            timings = []
+            for _ in range(repeat):
+                buffer = BytesIO()
+                start_time = time.perf_counter()
+                encodable(img, image_format).save(buffer, image_format, **options, **metadata)
+                timings.append(time.perf_counter() - start_time)
+            total = totals.setdefault((image_format, index), [0, 0.0, 0])
+            total[0] += buffer.tell()
+            total[1] += min(timings)
+            total[2] += 1
+
+    encoder = dict(settings['encoder'])
+    report = []
+    for image_format in sorted({image_format for image_format, _ in totals}):
+        results = [(index, total[0] / total[2], total[1] / total[2])
+                   for (fmt, index), total in sorted(totals.items()) if fmt == image_format]
+        fitting = [result for result in results if result[1] <= target_bytes]
+        if fitting:
+            chosen = min(fitting, key=lambda result: result[2])
+        else:
+            chosen = min(results, key=lambda result: result[1])
+        encoder[image_format] = dict(candidates[image_format][chosen[0]])
+        for index, mean_bytes, mean_seconds in results:
+            report.append({
+                'format': image_format,
+                'options': candidates[image_format][index],
+                'mean_bytes': round(mean_bytes),
+                'mean_seconds': round(mean_seconds, 4),
+                'chosen': index == chosen[0],
+            })
+    return dict(settings, encoder=encoder, quality=None), report
+
+def process_folder(path, step, settings, workers=1, queue_depth=4, output_folder='processed',
+                   should_stop=None, on_result=None, resume=True, recursive=False, memory_budget=0,
+                   presets=None, pool=None):
+    """Vignette every ``step``-th image in ``path`` into ``path/output_folder``.
+
+    Uses run_pool (reusing ``pool`` if given) when ``workers`` > 1, 0
+    meaning one per CPU, and run_pipeline otherwise; processing starts
+    while discovery is still running, so ``total`` in
+    ``on_result(done, total, name, ok, error, size)`` counts the images
+    found so far. ``recursive`` adds subfolders, mirrored in the output;
+    ``resume`` skips images the Manifest lists as unchanged;
+    ``memory_budget`` caps the bytes in flight (see MemoryBudget); and
+    ``presets`` from make_presets write each preset to
+    ``output_folder/<name>`` instead of using ``settings``. Raises
+    FileNotFoundError for a missing ``path``; returns a summary dict with
+    processed, failed, skipped, total and stopped.
+    """
+    if should_stop is None:
+        should_stop = lambda: False
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No such directory: {path}")
+    workers = workers or os.cpu_count() or 1
+
+    summary = {'processed': 0, 'failed': 0, 'skipped': 0, 'total': 0, 'stopped': False}
+    output_path = os.path.join(path, output_folder)
+    if presets:
+        settings = [preset_settings for _, preset_settings in presets]
+        output_dirs = [os.path.join(output_path, preset_name) for preset_name, _ in presets]
+        presets_settings = settings
+    else:
+        output_dirs = [output_path]
+        presets_settings = [settings]
+    manifest = Manifest(output_path)
+    settings_key = settings_hash(settings)
+    skip_dirs = set(OUTPUT_FOLDERS) | {output_folder}
+    discovery_done = threading.Event()
+
+    def discover():
+        made_dirs = set()
+        for i, (name, entry) in enumerate(_walk_images(path, recursive, skip_dirs)):
+            if i % step:
+                continue
+            summary['total'] += 1
+            save_paths = tuple(_output_path(output_dir, name, output_settings)
+                               for output_dir, output_settings in zip(output_dirs, presets_settings))
+            save_path = save_paths if presets else save_paths[0]
+            if resume and manifest.is_current(name, entry.path, save_path, settings_key, entry.stat()):
+                summary['skipped'] += 1
+                continue
+            for save_dir in map(os.path.dirname, save_paths):
+                if save_dir not in made_dirs:
+                    os.makedirs(save_dir, exist_ok=True)
+                    made_dirs.add(save_dir)
+            yield entry.path, save_path
+        discovery_done.set()
+
+    jobs = _prefetch(discover(), 1024, should_stop)
+    budget = MemoryBudget(memory_budget) if memory_budget else None
+    if workers > 1:
+        results = run_pool(jobs, settings, workers, should_stop, budget, pool)
+    else:
+        results = run_pipeline(jobs, settings, max(1, queue_depth), should_stop, budget)
+
+    try:
+        for (full_path, _), (ok, rows, error) in results:
+            collector.extend(rows)
+            img_name = os.path.relpath(full_path, path).replace(os.sep, '/')
+            if ok:
+                summary['processed'] += 1
+                manifest.record(img_name, full_path, settings_key)
+            else:
+                logging.error(f"Error processing {img_name}: {error}")
+                summary['failed'] += 1
+            if on_result:
+                done = summary['skipped'] + summary['processed'] + summary['failed']
+                on_result(done, summary['total'], img_name, ok, error, _file_size(full_path))
+    finally:
+        manifest.save()
+
+    if summary['skipped']:
+        logging.info(f"Skipped {summary['skipped']} unchanged images listed in the manifest")
+    done = summary['skipped'] + summary['processed'] + summary['failed']
+    summary['stopped'] = bool(should_stop()) and (done < summary['total'] or not discovery_done.is_set())
+    logging.info("Mask cache: %(hits)d hits, %(misses)d misses, %(entries)d entries, %(bytes)d bytes", mask_cache.stats())
+    logging.info("Stage timings:\n%s", collector.format_summary())
+    return summary
+
+def _file_size(full_path):
+    """Size of a file in bytes, or 0 if it is gone."""
+    try:
+        return os.path.getsize(full_path)
+    except OSError:
+        return 0
+
+def _scan_images(path):
+    """Return {name: stat result} for the image files directly in ``path``."""
+    found = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() not in VALID_EXTENSIONS:
+                continue
+            try:
+                if entry.is_file():
+                    found[entry.name] = entry.stat()
+            except OSError:
+                continue
+    return found
+
+def watch_folder(path, settings, output_folder='processed', queue_depth=4, poll_interval=0.25,
+                 settle_time=0.5, rescan_interval=5.0, should_stop=None, on_result=None):
+    """Vignette images in ``path`` as they arrive until ``should_stop()``.
+
+    Polls the folder instead of relying on OS file events. A file is
+    processed once its size and mtime have not changed for
+    ``settle_time`` seconds, so half-written files from a camera or copy
+    are left alone. Between arrivals only the directory's mtime is
+    checked; a full scan runs when it changes, while files are settling
+    and every ``rescan_interval`` seconds to catch files rewritten in
+    place. Files already listed in the Manifest are skipped, and files
+    that fail are retried only after they change. Everything runs in
+    this process, so the mask cache stays warm between files.
+    ``on_result(done, total, name, ok, error, size)`` is called after
+    each image, with ``total`` counting the images seen so far. Returns a
+    summary dict with processed, failed and skipped.
+    """
+    if should_stop is None:
+        should_stop = lambda: False
+    output_path = os.path.join(path, output_folder)
+    os.makedirs(output_path, exist_ok=True)
+    manifest = Manifest(output_path)
+    settings_key = settings_hash(settings)
+    summary = {'processed': 0, 'failed': 0, 'skipped': 0}
+
+    handled = {}   # name -> (size, mtime_ns) processed, skipped or failed
+    settling = {}  # name -> ((size, mtime_ns), time the stamp was first seen)
+    dir_mtime = None
+    last_scan = 0.0
+    try:
+        while not should_stop():
+            now = time.monotonic()
+            current_dir_mtime = os.stat(path).st_mtime_ns
+            if current_dir_mtime == dir_mtime and not settling and now - last_scan < rescan_interval:
+                time.sleep(poll_interval)
+                continue
+            dir_mtime = current_dir_mtime
+            last_scan = now
+
+            ready = []
+            for name, stat in _scan_images(path).items():
+                stamp = (stat.st_size, stat.st_mtime_ns)
+                if handled.get(name) == stamp:
+                    continue
+                full_path = os.path.join(path, name)
+                if name not in handled and manifest.is_current(
+                        name, full_path, _output_path(output_path, name, settings), settings_key, stat):
+                    handled[name] = stamp
+                    summary['skipped'] += 1
+                    continue
+                previous = settling.get(name)
+                if previous is None or previous[0] != stamp:
+                    settling[name] = (stamp, now)
+                elif now - previous[1] >= settle_time:
+                    del settling[name]
+                    handled[name] = stamp
+                    ready.append(name)
+
+            if ready:
+                jobs = [(os.path.join(path, name), _output_path(output_path, name, settings)) for name in sorted(ready)]
+                for (full_path, _), (ok, rows, error) in run_pipeline(jobs, settings, max(1, queue_depth), should_stop):
+                    collector.extend(rows)
+                    img_name = os.path.basename(full_path)
+                    if ok:
+                        summary['processed'] += 1
+                        manifest.record(img_name, full_path, settings_key)
+                    else:
+                        logging.error(f"Error processing {img_name}: {error}")
+                        summary['failed'] += 1
+                    if on_result:
+                        done = summary['processed'] + summary['failed']
+                        on_result(done, done + len(settling), img_name, ok, error, _file_size(full_path))
+                manifest.save()
+            else:
+                time.sleep(poll_interval)
+    finally:
+        manifest.save()
+    return summary
+
+# Archive types process_archive reads and writes, by file suffix
+ARCHIVE_MODES = {'.zip': 'zip', '.tar': 'w', '.tar.gz': 'w:gz', '.tgz': 'w:gz', '.tar.bz2': 'w:bz2',
+                 '.tbz2': 'w:bz2', '.tar.xz': 'w:xz', '.txz': 'w:xz'}
+
+def archive_suffix(path):
+    """Return the ARCHIVE_MODES suffix ``path`` ends with, or None."""
+    lower = path.lower()
+    matches = [suffix for suffix in ARCHIVE_MODES if lower.endswith(suffix)]
+    return max(matches, key=len) if matches else None
+
+def is_archive(path):
+    """Whether ``path`` is an existing ZIP or TAR file process_archive can read."""
+    return archive_suffix(path) is not None and os.path.isfile(path)
+
+def _member_name(name):
+    """Normalise an archive member name to a relative path with forward slashes."""
+    return '/'.join(part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..'))
+
+# Errors reading one member (bad CRC, encrypted, unsupported or truncated data) that fail just that image
+MEMBER_READ_ERRORS = (zipfile.BadZipFile, tarfile.TarError, RuntimeError, NotImplementedError, OSError,
+                      EOFError, zlib.error)
+
+def _read_member(read):
+    """Return (data, None) from ``read()``, or (None, error message) if the member cannot be read."""
+    try:
+        return read(), None
+    except MEMBER_READ_ERRORS as e:
+        return None, str(e) or type(e).__name__
+
+def iter_archive_images(archive_path, step=1):
+    """Yield (name, data, error) for every ``step``-th image in a ZIP or TAR file, in archive order.
+
+    Members are read one at a time, TAR files as a stream, so nothing is
+    extracted to disk. Folders, non-image files and macOS resource forks
+    are skipped and not counted for ``step``. A member that cannot be read
+    is yielded with ``data`` None and the reason in ``error``; damage to
+    the archive itself (e.g. a TAR stream cut short) still raises.
+    """
+    index = 0
+    if archive_suffix(archive_path) == '.zip':
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                name = _member_name(info.filename)
+                if info.is_dir() or name.startswith('__MACOSX/'):
+                    continue
+                if os.path.splitext(name)[1].lower() not in VALID_EXTENSIONS:
+                    continue
+                if index % step == 0:
+                    yield (name,) + _read_member(lambda: archive.read(info))
+                index += 1
+        return
+    with tarfile.open(archive_path, 'r|*') as archive:
+        for member in archive:
+            name = _member_name(member.name)
+            if not member.isfile() or os.path.splitext(name)[1].lower() not in VALID_EXTENSIONS:
+                continue
+            if index % step == 0:
+                yield (name,) + _read_member(lambda: archive.extractfile(member).read())
+            index += 1
+
+class _MemberFile(BytesIO):
+    """An archive member's bytes as a file, or one that fails to open with the member's read error.
+
+    Its repr is the member name, which PIL puts in errors such as
+    "cannot identify image file".
+    """
+    def __init__(self, name, data, error=None):
+        super().__init__(data or b'')
+        self.member_name = name
+        self.size = len(data or b'')
+        self.error = error
+
+    def __repr__(self):
+        return repr(self.member_name)
+
+    def read(self, *args):
+        if self.error is not None:
+            raise OSError(f"Cannot read archive member: {self.error}")
+        return super().read(*args)
+
+class ArchiveWriter:
+    """Add members to a new ZIP or TAR file from a dedicated thread.
+
+    ``put`` hands encoded bytes to the writer through a queue holding at
+    most ``depth`` members, so compressing and writing the archive overlap
+    with processing. The archive is written under a ``.part`` name and
+    only renamed to ``path`` by a successful close. Members are stored
+    uncompressed in ZIP files, since the images are compressed already.
+    Each member's write time is recorded as a ``write`` sample.
+    """
+    def __init__(self, path, depth=4):
+        self.path = path
+        self.error = None
+        self._part_path = path + '.part'
+        mode = ARCHIVE_MODES[archive_suffix(path)]
+        if mode == 'zip':
+            self._archive = zipfile.ZipFile(self._part_path, 'w', zipfile.ZIP_STORED)
+        else:
+            self._archive = tarfile.open(self._part_path, mode)
+        self._queue = queue.Queue(maxsize=depth)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, name, data):
+        """Queue one member; raises the writer's error if writing has failed."""
+        if self.error is not None:
+            raise self.error
+        self._queue.put((name, data))
+
+    def _write(self, name, data):
+        if isinstance(self._archive, zipfile.ZipFile):
+            self._archive.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self._archive.addfile(info, BytesIO(data))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue  # keep draining so put never blocks
+            start_time = time.perf_counter()
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.error = e
+            collector.record('write', time.perf_counter() - start_time)
+
+    def close(self, publish=True):
+        """Finish the archive and move it into place.
+
+        With ``publish`` False (a stopped or failed run) the partial
+        archive is removed instead. Raises the writer's error, after
+        removing the archive, if writing failed.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._archive.close()
+        except Exception as e:
+            self.error = self.error or e
+        if self.error is not None or not publish:
+            os.remove(self._part_path)
+        if self.error is not None:
+            raise self.error
+        if publish:
+            os.replace(self._part_path, self.path)
+
+def process_archive(archive_path, step, settings, output_path=None, queue_depth=4, output_folder='processed',
+                    should_stop=None, on_result=None, presets=None):
+    """Vignette every ``step``-th image in a ZIP or TAR file into a new archive.
+
+    Images are read from the archive members, run through run_pipeline
+    and written by an ArchiveWriter, so nothing touches the disk but the
+    two archives. The output goes to ``output_path``, by default next to
+    the input and named ``<name>_<output_folder>`` with the same archive
+    type. Member paths are kept; ``presets`` put each preset's variants
+    under ``<preset name>/``. ``on_result`` and the returned summary work
+    as in process_folder, and the summary also holds the ``output`` path,
+    which is None when the run was stopped and no archive was written.
+    Raises FileNotFoundError if ``archive_path`` does not exist.
+    """
+    if should_stop is None:
+        should_stop = lambda: False
+    if not os.path.isfile(archive_path):
+        raise FileNotFoundError(f"No such archive: {archive_path}")
+    suffix = archive_suffix(archive_path)
+    if suffix is None:
+        raise ValueError(f"Not a ZIP or TAR archive: {archive_path}")
+    if output_path is None:
+        output_path = f"{archive_path[:-len(suffix)]}_{output_folder}{suffix}"
+    if archive_suffix(output_path) is None:
+        raise ValueError(f"Not a ZIP or TAR file name: {output_path}")
+
+    if presets:
+        settings = [preset_settings for _, preset_settings in presets]
+        outputs = [(preset_name + '/', preset_settings) for preset_name, preset_settings in presets]
+    else:
+        outputs = [('', settings)]
+    summary = {'processed': 0, 'failed': 0, 'skipped': 0, 'total': 0, 'stopped': False, 'output': output_path}
+    discovery_done = threading.Event()
+
+    def discover():
+        for name, data, error in iter_archive_images(archive_path, step):
+            summary['total'] += 1
+            save_names = tuple(
+                prefix + (posixpath.splitext(name)[0] + output_settings['format'] if output_settings['format'] else name)
+                for prefix, output_settings in outputs)
+            # An unreadable member fails when the pipeline opens it, so it is reported in order
+            yield _MemberFile(name, data, error), save_names if presets else save_names[0], name
+        discovery_done.set()
+
+    writer = ArchiveWriter(output_path, queue_depth)
+
+    def save(result, save_name, rows, variant_settings):
+        start_time = time.perf_counter()
+        data = encode_image(result, save_name, variant_settings)
+        rows.append(timing_row('encode', time.perf_counter() - start_time))
+        writer.put(save_name, data)
+
+    jobs = _prefetch(discover(), max(1, queue_depth), should_stop)
+    complete = False
+    try:
+        for (member, _, img_name), (ok, rows, error) in run_pipeline(jobs, settings, max(1, queue_depth), should_stop, save=save):
+            collector.extend(rows)
+            if ok:
+                summary['processed'] += 1
+            else:
+                logging.error(f"Error processing {img_name}: {error}")
+                summary['failed'] += 1
+            if on_result:
+                on_result(summary['processed'] + summary['failed'], summary['total'], img_name, ok, error, member.size)
+        done = summary['processed'] + summary['failed']
+        summary['stopped'] = bool(should_stop()) and (done < summary['total'] or not discovery_done.is_set())
+        complete = not summary['stopped']
+    finally:
+        # A stopped or failed run would leave an archive missing images; drop it
+        writer.close(publish=complete)
+
+    if not complete:
+        summary['output'] = None
+    logging.info("Stage timings:\n%s", collector.format_summary())
+    return summary
@@ -0,0 +1,227 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from metrics import collector
+from vignette import (ENCODER_PROFILES, LARGE_IMAGE_PIXELS, allow_large_images, calibrate_encoder, is_archive,
+                      make_presets, make_settings, process_archive, process_folder, watch_folder)
+
+def emit(event, **fields):
+    """Write one progress event as a JSON line on stdout."""
+    fields['event'] = event
+    sys.stdout.write(json.dumps(fields) + "\n")
+    sys.stdout.flush()
+
+def build_parser():
+    """Build the command-line argument parser."""
+    parser = argparse.ArgumentParser(
+        description="Add a vignette to every image in a folder without the GUI. "
+                    "Progress is written to stdout as one JSON object per line."
+    )
+    parser.add_argument("folder", help="folder containing the images, or a ZIP or TAR archive of them")
+    parser.add_argument("--archive-output", metavar="PATH", help="for an archive input, the archive to write "
+                        "(default: <name>_processed next to the input, same type)")
+    parser.add_argument("--strength", type=float, default=2.5, help="vignette strength, 0.1 to 10 (default 2.5)")
+    parser.add_argument("--radius", type=float, default=4.0, help="radius divisor, larger means a smaller clear zone (default 4.0)")
+    parser.add_argument("--color", default="#000000", help="vignette color as a hex string (default #000000)")
+    parser.add_argument("--step", type=int, default=1, help="process every Nth image (default 1)")
+    parser.add_argument("--debug", action="store_true", help="green vignette with the debug overlay, written to processed_debug")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 for one per CPU (default 1)")
+    parser.add_argument("--queue-depth", type=int, default=4, help="images buffered between pipeline stages (default 4)")
+    parser.add_argument("--mask-tolerance", type=float, default=0, help="allowed mask error in levels for downscaled masks (default 0, exact)")
+    parser.add_argument("--strip-threshold-mp", type=float, default=64, help="megapixels above which images are processed in strips (default 64)")
+    parser.add_argument("--strip-rows", type=int, default=2048, help="rows per strip (default 2048)")
+    parser.add_argument("--max-megapixels", type=float, default=LARGE_IMAGE_PIXELS / 1e6,
+                        help="decompression-bomb limit: larger images log a warning and ones twice as large "
+                             "are refused (default %(default)g)")
+    parser.add_argument("--encoder", default="default", choices=sorted(ENCODER_PROFILES),
+                        help="encoder profile: save options per output format (default %(default)s)")
+    parser.add_argument("--strip-metadata", action="store_true", help="do not copy EXIF and ICC data to the outputs")
+    parser.add_argument("--calibrate-kb", type=float, default=0, metavar="KB",
+                        help="before the batch, time encoder options on a sample of it and use the fastest "
+                             "that keeps the mean output size under KB")
+    parser.add_argument("--calibrate-sample", type=int, default=8, help="images sampled by --calibrate-kb (default 8)")
+    parser.add_argument("--presets", metavar="JSON", help="sweep: JSON file with a list of presets, each a \"name\" plus any of "
+                        "vignette_strength, diagonal_radius, color, max_size, quality, output_format, encoder; every image "
+                        "is decoded once and each preset is written to its own subfolder")
+    parser.add_argument("--recursive", action="store_true", help="also process subfolders, mirroring their layout in the output folder")
+    parser.add_argument("--watch", action="store_true", help="keep running and process images as they are added to the folder, until Ctrl+C")
+    parser.add_argument("--memory-budget-mb", type=float, default=0, help="cap the estimated memory of images being processed at once, 0 for no cap (default 0)")
+    parser.add_argument("--metrics-log", metavar="CSV", help="append per-stage timings to this CSV file")
+    parser.add_argument("--no-resume", action="store_true", help="reprocess every image instead of skipping ones listed as done in the output manifest")
+    return parser
+
+# Options only process_folder honours, as (flag, argument name, value that leaves it off)
+FOLDER_ONLY_OPTIONS = (('--workers', 'workers', 1), ('--recursive', 'recursive', False),
+                       ('--memory-budget-mb', 'memory_budget_mb', 0), ('--no-resume', 'no_resume', False))
+
+# Watch mode also processes every image with one set of settings
+WATCH_IGNORED_OPTIONS = FOLDER_ONLY_OPTIONS + (('--step', 'step', 1), ('--presets', 'presets', None))
+
+def unsupported(args, options):
+    """Return the flags among ``options`` that were given a value other than their off value."""
+    return [flag for flag, name, off in options if getattr(args, name) != off]
+
+def emit_metrics(args):
+    """Emit the per-stage timing summary and append the samples to --metrics-log."""
+    emit("metrics", stages=collector.summary())
+    if args.metrics_log:
+        collector.persist(args.metrics_log)
+
+def calibrate(args, settings, presets):
+    """Apply --calibrate-kb to the settings and every preset, emitting each choice."""
+    if not os.path.isdir(args.folder):
+        raise FileNotFoundError(args.folder)
+
+    def run(name, preset_settings):
+        calibrated, report = calibrate_encoder(
+            args.folder, preset_settings, args.calibrate_kb * 1000,
+            step=args.step, recursive=args.recursive, sample_size=max(1, args.calibrate_sample),
+        )
+        emit("calibration", preset=name, encoder=calibrated['encoder'], candidates=report)
+        return calibrated
+
+    if presets:
+        return settings, [(name, run(name, preset_settings)) for name, preset_settings in presets]
+    return run(None, settings), None
+
+def watch(args, settings, stop, on_result, start_time):
+    """Run watch mode until interrupted and return the exit code."""
+    if not os.path.isdir(args.folder):
+        emit("error", message=f"Folder not found: {args.folder}")
+        return 2
+    emit("watching", folder=args.folder)
+    result = {}
+    finished = threading.Event()
+
+    def run():
+        try:
+            result.update(watch_folder(
+                args.folder, settings,
+                output_folder='processed_debug' if args.debug else 'processed',
+                queue_depth=args.queue_depth,
+                should_stop=stop.is_set,
+                on_result=on_result,
+            ))
+        finally:
+            finished.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        # Wait in short slices so Ctrl+C is delivered on Windows too
+        while not finished.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        stop.set()
+        finished.wait()
+    emit_metrics(args)
+    emit("summary", stopped=stop.is_set(), seconds=round(time.time() - start_time, 3), **result)
+    return 130 if stop.is_set() else 0
+
+def main(argv=None):
+    """Run a batch from the command line and return the process exit code."""
+    args = build_parser().parse_args(argv)
+    if args.step < 1:
+        emit("error", message="--step must be at least 1")
+        return 2
+    if args.watch and unsupported(args, WATCH_IGNORED_OPTIONS):
+        emit("error", message=f"{', '.join(unsupported(args, WATCH_IGNORED_OPTIONS))} cannot be used with --watch")
+        return 2
+    if args.max_megapixels <= 0:
+        emit("error", message="--max-megapixels must be positive")
+        return 2
+    allow_large_images(int(args.max_megapixels * 1e6))
+
+    options = dict(
+        vignette_strength=args.strength,
+        diagonal_radius=args.radius,
+        color=(0, 255, 0) if args.debug else args.color,
+        mask_tolerance=args.mask_tolerance,
+        strip_threshold_mp=args.strip_threshold_mp,
+        strip_rows=args.strip_rows,
+        debug_overlay=args.debug,
+        encoder=args.encoder,
+        keep_metadata=not args.strip_metadata,
+    )
+    try:
+        settings = make_settings(**options)
+    except ValueError as e:
+        emit("error", message=str(e))
+        return 2
+    presets = None
+    if args.presets:
+        try:
+            with open(args.presets, 'r') as f:
+                presets = make_presets(json.load(f), **options)
+        except (OSError, ValueError, TypeError) as e:
+            emit("error", message=f"Could not load presets from {args.presets}: {e}")
+            return 2
+    archive = is_archive(args.folder)
+    if archive and (args.watch or args.calibrate_kb > 0):
+        emit("error", message="--watch and --calibrate-kb need a folder, not an archive")
+        return 2
+    if archive and unsupported(args, FOLDER_ONLY_OPTIONS):
+        emit("error", message=f"{', '.join(unsupported(args, FOLDER_ONLY_OPTIONS))} cannot be used with an archive")
+        return 2
+    if not archive and args.archive_output:
+        emit("error", message="--archive-output needs an existing ZIP or TAR file as input")
+        return 2
+    if args.calibrate_kb > 0:
+        try:
+            settings, presets = calibrate(args, settings, presets)
+        except FileNotFoundError:
+            emit("error", message=f"Folder not found: {args.folder}")
+            return 2
+    stop = threading.Event()
+
+    def on_result(done, total, img_name, ok, error, size):
+        emit("image", file=img_name, ok=ok, error=error, done=done, total=total)
+
+    start_time = time.time()
+    if args.watch:
+        return watch(args, settings, stop, on_result, start_time)
+    try:
+        if archive:
+            summary = process_archive(
+                args.folder, args.step, settings,
+                output_path=args.archive_output,
+                queue_depth=args.queue_depth,
+                output_folder='processed_debug' if args.debug else 'processed',
+                should_stop=stop.is_set,
+                on_result=on_result,
+                presets=presets,
+            )
+        else:
+            summary = process_folder(
+                args.folder, args.step, settings,
+                workers=args.workers,
+                queue_depth=args.queue_depth,
+                output_folder='processed_debug' if args.debug else 'processed',
+                should_stop=stop.is_set,
+                on_result=on_result,
+                resume=not args.no_resume,
+                recursive=args.recursive,
+                memory_budget=int(args.memory_budget_mb * 1e6),
+                presets=presets,
+            )
+    except ValueError as e:
+        emit("error", message=str(e))
+        return 2
+    except FileNotFoundError:
+        emit("error", message=f"Folder not found: {args.folder}")
+        return 2
+    except KeyboardInterrupt:
+        stop.set()
+        emit("summary", stopped=True, seconds=round(time.time() - start_time, 3))
+        return 130
+
+    emit_metrics(args)
+    emit("summary", seconds=round(time.time() - start_time, 3), **summary)
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
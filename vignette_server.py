@@ -0,0 +1,368 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+
+from metrics import MemorySampler, collector, timing_row
+from vignette import (VALID_EXTENSIONS, fit_size, make_presets, make_settings, mask_cache,
+                      process_folder, process_variants)
+
+DEFAULT_PORT = 8765
+
+# Job fields returned to clients; the rest (settings, stop event) stay internal
+PUBLIC_FIELDS = ('id', 'path', 'kind', 'status', 'submitted', 'started', 'finished',
+                 'done', 'total', 'summary', 'stages', 'error')
+
+class JobServer:
+    """Queue of vignette jobs run one at a time by a long-lived process.
+
+    Jobs run in submission order on a single runner thread, so each gets
+    the whole machine and its timings are its own. Because the process
+    stays up, the mask cache (and, with ``workers`` > 1, the pool of
+    worker processes and their caches) stays warm from one job to the
+    next.
+    """
+    def __init__(self, workers=1, queue_depth=4):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = queue_depth
+        self.pool = None
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            # Start the workers and import the processing module in each now
+            for future in [self.pool.submit(fit_size, (1, 1), 0) for _ in range(self.workers)]:
+                future.result()
+        self.jobs = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._runner = threading.Thread(target=self._run, daemon=True)
+        self._runner.start()
+
+    def submit(self, spec):
+        """Validate a job spec and queue it, returning the job's public view.
+
+        ``spec`` has a ``path`` (a folder or one image) plus optional
+        ``settings`` (make_settings arguments), ``presets``, ``step``,
+        ``recursive``, ``resume``, ``memory_budget_mb`` and
+        ``output_folder``. Raises ValueError for a bad spec.
+        """
+        if not isinstance(spec, dict) or not isinstance(spec.get('path'), str):
+            raise ValueError("A job needs a 'path'")
+        path = os.path.abspath(spec['path'])
+        if os.path.isdir(path):
+            kind = 'folder'
+        elif os.path.isfile(path) and os.path.splitext(path)[1].lower() in VALID_EXTENSIONS:
+            kind = 'file'
+        else:
+            raise ValueError(f"Not a folder or supported image: {spec['path']}")
+        options = spec.get('settings') or {}
+        try:
+            settings = make_settings(**options)
+            presets = make_presets(spec['presets'], **options) if spec.get('presets') else None
+            step = int(spec.get('step', 1))
+            memory_budget = int(float(spec.get('memory_budget_mb', 0)) * 1e6)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid job: {e}")
+        if step < 1:
+            raise ValueError("'step' must be at least 1")
+        output_folder = str(spec.get('output_folder', 'processed'))
+        if not output_folder or os.path.isabs(output_folder) or '..' in output_folder.replace('\\', '/').split('/'):
+            raise ValueError(f"Invalid output folder: {output_folder!r}")
+
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'path': path,
+            'kind': kind,
+            'status': 'queued',
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'done': 0,
+            'total': 1 if kind == 'file' else 0,
+            'summary': None,
+            'stages': None,
+            'error': None,
+            'settings': settings,
+            'presets': presets,
+            'step': step,
+            'recursive': bool(spec.get('recursive', False)),
+            'resume': bool(spec.get('resume', True)),
+            'memory_budget': memory_budget,
+            'output_folder': output_folder,
+            'stop': threading.Event(),
+        }
+        with self._lock:
+            self.jobs[job['id']] = job
+            self._order.append(job['id'])
+        self._queue.put(job)
+        return self.view(job['id'])
+
+    def view(self, job_id):
+        """Return the public fields of a job, or None if there is no such job."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {field: job[field] for field in PUBLIC_FIELDS}
+
+    def list(self):
+        """Return the public view of every job, oldest first."""
+        with self._lock:
+            job_ids = list(self._order)
+        return [self.view(job_id) for job_id in job_ids]
+
+    def cancel(self, job_id):
+        """Ask a job to stop; a queued job is skipped, a running one stops after its current images."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job['stop'].set()
+            if job['status'] == 'queued':
+                job['status'] = 'cancelled'
+        return self.view(job_id)
+
+    def health(self):
+        """Return the server's state and its warm caches."""
+        with self._lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {'status': 'ok', 'workers': self.workers, 'jobs': counts, 'mask_cache': mask_cache.stats()}
+
+    def close(self):
+        """Stop every job and the worker processes."""
+        with self._lock:
+            for job in self.jobs.values():
+                job['stop'].set()
+        self._queue.put(None)
+        self._runner.join()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job['stop'].is_set():
+                continue
+            self._update(job, status='running', started=time.time())
+            collector.clear()
+            try:
+                if job['kind'] == 'file':
+                    summary = self._process_file(job)
+                else:
+                    summary = self._process_folder(job)
+                status = 'cancelled' if summary['stopped'] else 'done'
+                error = None
+            except Exception as e:
+                logging.error(f"Job {job['id']} failed: {e}")
+                summary, status, error = None, 'failed', str(e)
+            self._update(job, status=status, summary=summary, error=error,
+                         stages=collector.summary(), finished=time.time())
+
+    def _process_folder(self, job):
+        def on_result(done, total, img_name, ok, error, size):
+            self._update(job, done=done, total=total)
+
+        return process_folder(
+            job['path'], job['step'], job['settings'],
+            workers=self.workers,
+            queue_depth=self.queue_depth,
+            output_folder=job['output_folder'],
+            should_stop=job['stop'].is_set,
+            on_result=on_result,
+            resume=job['resume'],
+            recursive=job['recursive'],
+            memory_budget=job['memory_budget'],
+            presets=job['presets'],
+            pool=self.pool,
+        )
+
+    def _process_file(self, job):
+        """Vignette a single image in this process, where the mask cache is warm."""
+        folder, name = os.path.split(job['path'])
+        output_dir = os.path.join(folder, job['output_folder'])
+        presets = job['presets'] or [(None, job['settings'])]
+        outputs = []
+        for preset_name, settings in presets:
+            save_dir = os.path.join(output_dir, preset_name) if preset_name else output_dir
+            save_path = os.path.join(save_dir, name)
+            if settings['format']:
+                save_path = os.path.splitext(save_path)[0] + settings['format']
+            os.makedirs(save_dir, exist_ok=True)
+            outputs.append((save_path, settings))
+
+        overall_start = time.perf_counter()
+        with MemorySampler() as sampler:
+            rows = process_variants(job['path'], outputs)
+        rows.append(timing_row('total', time.perf_counter() - overall_start))
+        if sampler.peak is not None:
+            rows.append(timing_row('peak_memory', sampler.peak))
+        collector.extend(rows)
+        self._update(job, done=1)
+        return {'processed': 1, 'failed': 0, 'skipped': 0, 'total': 1, 'stopped': False}
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """JSON API over a JobServer.
+
+    GET /health, GET /jobs, GET /jobs/<id>, POST /jobs (body: a job spec,
+    see JobServer.submit) and DELETE /jobs/<id> to cancel.
+    """
+    server_version = "VignetteServer/1.0"
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self):
+        parts = self.path.rstrip('/').split('/')
+        return parts[2] if len(parts) == 3 and parts[1] == 'jobs' else None
+
+    def do_GET(self):
+        jobs = self.server.jobs
+        if self.path == '/health':
+            return self._send(200, jobs.health())
+        if self.path.rstrip('/') == '/jobs':
+            return self._send(200, {'jobs': jobs.list()})
+        job = jobs.view(self._job_id()) if self._job_id() else None
+        if job is None:
+            return self._send(404, {'error': 'Not found'})
+        self._send(200, job)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            return self._send(404, {'error': 'Not found'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            job = self.server.jobs.submit(json.loads(self.rfile.read(length) or b'null'))
+        except ValueError as e:  # json.JSONDecodeError is a ValueError too
+            return self._send(400, {'error': str(e)})
+        self._send(202, job)
+
+    def do_DELETE(self):
+        job = self.server.jobs.cancel(self._job_id()) if self._job_id() else None
+        if job is None:
+            return self._send(404, {'error': 'Not found'})
+        self._send(200, job)
+
+    def log_message(self, format, *args):
+        logging.info("%s %s", self.address_string(), format % args)
+
+def make_server(host='127.0.0.1', port=DEFAULT_PORT, workers=1, queue_depth=4):
+    """Create the HTTP server with its JobServer; call serve_forever to run it."""
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.jobs = JobServer(workers, queue_depth)
+    return server
+
+class Client:
+    """Minimal client for the job server, using only the standard library."""
+    def __init__(self, url=f"http://127.0.0.1:{DEFAULT_PORT}"):
+        self.url = url.rstrip('/')
+
+    def _call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urlrequest.Request(self.url + path, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'})
+        try:
+            with urlrequest.urlopen(req) as response:
+                return json.load(response)
+        except HTTPError as e:
+            raise ValueError(json.load(e).get('error', str(e)))
+
+    def health(self):
+        return self._call('GET', '/health')
+
+    def submit(self, path, **spec):
+        """Queue a folder or image; ``spec`` holds the other JobServer.submit fields."""
+        return self._call('POST', '/jobs', dict(spec, path=path))
+
+    def job(self, job_id):
+        return self._call('GET', f'/jobs/{job_id}')
+
+    def cancel(self, job_id):
+        return self._call('DELETE', f'/jobs/{job_id}')
+
+    def wait(self, job_id, poll_interval=0.1, timeout=None):
+        """Poll until the job is no longer queued or running and return it."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.job(job_id)
+            if job['status'] not in ('queued', 'running'):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} still {job['status']}")
+            time.sleep(poll_interval)
+
+def build_parser():
+    """Build the command-line argument parser."""
+    parser = argparse.ArgumentParser(
+        description="Run the vignette pipeline as a local job server, or submit a job to one."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the server until Ctrl+C")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default %(default)s, this machine only)")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT, help="port, 0 for any free one (default %(default)s)")
+    serve.add_argument("--workers", type=int, default=1, help="worker processes kept running, 0 for one per CPU (default 1)")
+    serve.add_argument("--queue-depth", type=int, default=4, help="images buffered between pipeline stages (default 4)")
+
+    submit = commands.add_parser("submit", help="queue a folder or image and print the job")
+    submit.add_argument("path", help="folder or image to process")
+    submit.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}", help="server address (default %(default)s)")
+    submit.add_argument("--settings", default="{}", metavar="JSON", help="make_settings arguments as a JSON object")
+    submit.add_argument("--step", type=int, default=1, help="process every Nth image (default 1)")
+    submit.add_argument("--recursive", action="store_true", help="also process subfolders")
+    submit.add_argument("--wait", action="store_true", help="wait for the job and print its final state")
+    return parser
+
+def main(argv=None):
+    """Serve or submit, returning the process exit code."""
+    args = build_parser().parse_args(argv)
+    if args.command == "submit":
+        client = Client(args.url)
+        try:
+            job = client.submit(os.path.abspath(args.path), settings=json.loads(args.settings),
+                                step=args.step, recursive=args.recursive)
+            if args.wait:
+                job = client.wait(job['id'])
+        except (OSError, ValueError) as e:
+            print(json.dumps({'error': str(e)}))
+            return 2
+        print(json.dumps(job))
+        return 0 if job['status'] in ('queued', 'running', 'done') else 1
+
+    server = make_server(args.host, args.port, args.workers, args.queue_depth)
+    host, port = server.server_address[:2]
+    print(json.dumps({'event': 'listening', 'url': f"http://{host}:{port}"}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.jobs.close()
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,18 +1,28 @@
-﻿import customtkinter as ctk
+﻿import time
+import os
+import sys
+
+# Startup profiling: (label, perf_counter) checkpoints, see report_startup
+STARTUP_MARKS = [("start", time.perf_counter())]
+
+def mark_startup(label):
+    """Record a startup checkpoint for the startup-time report."""
+    STARTUP_MARKS.append((label, time.perf_counter()))
+
+import customtkinter as ctk
 import tkinter
 from tkinter import colorchooser, filedialog
-from PIL import Image, ImageDraw, ImageFilter, ImageTk
-import numpy as np
-import math
-import os
+mark_startup("import customtkinter")
+
+# NumPy, PIL, csv, plyer and the processing module are imported where they
+# are first used, so none of them delay the window appearing
 import threading
+import queue
+import multiprocessing
 import json
-import time
-from functools import wraps
 import logging
-import csv
-from plyer import notification
-import sys
+from metrics import collector
+mark_startup("import app modules")
 
 def resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -32,85 +42,16 @@ logging.basicConfig(
     ] if DEBUG_MODE else []
 )
 
-timings = []
-
-def log_execution_time(func):
-    """Decorator to record each function call as a separate row in the CSV."""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = end_time - start_time
-        logging.info("Function '%s' executed in %.4f seconds", func.__name__, execution_time)
-        timings.append({
-            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
-            'func_name': func.__name__,
-            'execution_time': f"{execution_time:.4f}"
-        })
-        return result
-    return wrapper
-
-def hex_to_rgb(hex_color):
-    """Convert hex color to RGB tuple."""
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-
-def create_circular_mask(size, radius, vignette_strength):
-    """Create circular vignette mask with optimized NumPy operations."""
-    width, height = size
-    center_x = (width - 1) * 0.5
-    center_y = (height - 1) * 0.5
-
-    # Use meshgrid with float32 for faster computation
-    x = np.arange(width, dtype=np.float32)
-    y = np.arange(height, dtype=np.float32)
-    X, Y = np.meshgrid(x, y)
-
-    # Calculate distance from center using hypot (faster than manual sqrt)
-    X -= center_x
-    Y -= center_y
-    dist = np.hypot(X, Y)
-
-    # Calculate fade range
-    corner_dist = math.hypot(center_x, center_y)
-    
-    # FIX: When vignette_strength is high, reduce fade_range dramatically
-    # This creates a sharper edge at high strength values
-    if vignette_strength >= 5.0:
-        # At strength 10, fade_range becomes very small (sharp edge)
-        strength_factor = (10.0 - vignette_strength) / 5.0  # 1.0 at strength=5, 0.0 at strength=10
-        strength_factor = max(0.05, strength_factor)  # Minimum 5% fade range
-        fade_range = (corner_dist - radius) * strength_factor
-    else:
-        fade_range = corner_dist - radius
-    
-    if fade_range <= 0:
-        fade_range = corner_dist * 0.3
-
-    # Vectorized mask calculation - minimize intermediate arrays
-    # Compute (dist - radius), clamp to [0, fade_range], normalize, apply power
-    np.maximum(dist, radius, out=dist)  # dist = max(dist, radius)
-    dist -= radius  # dist = dist_beyond_radius
-    dist *= (1.0 / fade_range)  # normalize
-    np.minimum(dist, 1.0, out=dist)  # clamp to 1.0
-    
-    # Apply vignette strength and convert to mask
-    np.power(dist, vignette_strength, out=dist)
-    dist *= -255.0
-    dist += 255.0
-    mask = dist.astype(np.uint8)
-
-    # Create image from array
-    mask_image = Image.fromarray(mask, mode='L')
-
-    # Single Gaussian blur pass (faster than double box blur)
-    # Reduce blur for high strength values to maintain sharp edge
-    blur_amount = max(1, int(fade_range // 25))
-    if blur_amount > 1 and vignette_strength < 8.0:
-        mask_image = mask_image.filter(ImageFilter.GaussianBlur(blur_amount))
-
-    return mask_image
+def report_startup():
+    """Format the startup checkpoints as a per-step breakdown in milliseconds."""
+    start = STARTUP_MARKS[0][1]
+    lines = ["Startup time:"]
+    for (_, previous), (label, t) in zip(STARTUP_MARKS, STARTUP_MARKS[1:]):
+        lines.append(f"  {label:<24}{(t - previous) * 1000:8.1f} ms")
+    lines.append(f"  {'total':<24}{(STARTUP_MARKS[-1][1] - start) * 1000:8.1f} ms")
+    loaded = [name for name in ("numpy", "PIL", "plyer", "vignette") if name in sys.modules]
+    lines.append(f"  heavy modules loaded: {', '.join(loaded) or 'none'}")
+    return "\n".join(lines)
 
 class AppState:
     """Application state and global configuration variables"""
@@ -120,14 +61,41 @@ class AppState:
         self.processing = False
         self.debug_mode = False
         self.stop_processing = False
+        # Worker -> Tk thread progress events, see VignetteApp._drain_progress
+        self.progress_queue = queue.Queue()
+        self.images_done = 0
+        self.bytes_done = 0
+        self.batch_started = 0.0
+        # Live preview: background renderer (created on first use) and pending debounce
+        self.preview = None
+        self.preview_after = None
 
 class VignetteApp:
     SETTINGS_FILE = "vignette_settings.json"
+    # Append-only per-stage timings, written in debug mode
+    METRICS_FILE = "metrics_log.csv"
+    # How often the Tk thread applies queued progress events
+    PROGRESS_INTERVAL_MS = 100
+    # Preview: long edge in pixels, quiet time before re-rendering, result polling
+    PREVIEW_SIZE = 400
+    PREVIEW_DEBOUNCE_MS = 30
+    PREVIEW_POLL_MS = 20
     DEFAULT_SETTINGS = {
         "vignette_strength": "2.5",
         "diagonal_radius": "4.0",
         "vignette_color": "#000000",
-        "spinbox_step": "1"
+        "spinbox_step": "1",
+        "mask_tolerance": "0",
+        "workers": "1",
+        "queue_depth": "4",
+        "strip_threshold_mp": "64",
+        "strip_rows": "2048",
+        "resume": True,
+        "recursive": False,
+        "memory_budget_mb": "0",
+        "encoder_profile": "default",
+        "keep_metadata": True,
+        "sweep_presets": []
     }
 
     def __init__(self):
@@ -135,7 +103,9 @@ class VignetteApp:
         self.window = None
         self.frame = None
         self.widgets = {}
+        self.settings = {}
         self.setup_ui()
+        mark_startup("setup_ui")
 
     def load_settings(self):
         """Load settings from JSON file"""
@@ -150,12 +120,14 @@ class VignetteApp:
     def save_settings(self):
         """Save current settings to JSON file."""
         try:
-            settings = {
+            # Keep options that have no widget (e.g. workers, queue_depth) as loaded
+            settings = dict(self.settings)
+            settings.update({
                 "vignette_strength": self.widgets['vignette_strength_value'].get(),
                 "diagonal_radius": self.widgets['diagonal_radius_value'].get(),
                 "vignette_color": self.state.chosen_color,
                 "spinbox_step": self.widgets['spinbox_value'].get()
-            }
+            })
             with open(self.SETTINGS_FILE, 'w') as f:
                 json.dump(settings, f, indent=4)
         except Exception as e:
@@ -168,297 +140,178 @@ class VignetteApp:
         self.widgets['spinbox_value'].set(self.DEFAULT_SETTINGS["spinbox_step"])
         self.state.chosen_color = self.DEFAULT_SETTINGS["vignette_color"]
         self.widgets['soft_edge_color'].configure(fg_color=self.state.chosen_color)
+        self._schedule_preview()
 
-    @log_execution_time
-    def add_debug_overlay(self, result, width, height, vignette_strength, diagonal_radius):
-        """Add debug visualization overlay to the image."""
-        from PIL import ImageFont
-        draw = ImageDraw.Draw(result)
-
-        center_x = (width - 1) / 2.0
-        center_y = (height - 1) / 2.0
-        diagonal = math.sqrt(width**2 + height**2)
-        actual_radius = int(diagonal / diagonal_radius)
-        corner_dist = math.sqrt(center_x**2 + center_y**2)
+    def process_images(self, path, step, options):
+        """Process all images in the specified path on a worker thread.
 
-        fade_range = corner_dist - actual_radius
-        if fade_range <= 0:
-            fade_range = corner_dist * 0.3
+        Never touches Tk: progress and the final summary are posted to
+        ``self.state.progress_queue`` and applied by _drain_progress on
+        the main thread.
+        """
+        collector.clear()
+        progress = self.state.progress_queue
+        from vignette import (allow_large_images, is_archive, make_presets, make_settings, process_archive,
+                              process_folder)
+        # The GUI only opens folders the user picked, so panoramas past PIL's limit are allowed
+        allow_large_images()
 
-        base_size = min(width, height)
-        font_size = max(14, base_size // 35)
-        small_font_size = max(12, base_size // 40)
+        def update_progress(done, total, img_name, ok, error, size):
+            progress.put(('image', done, total, size))
 
         try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-            small_font = ImageFont.truetype("arial.ttf", small_font_size)
-            title_font = ImageFont.truetype("arialbd.ttf", font_size + 2)
-        except:
-            try:
-                font = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", font_size)
-                small_font = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", small_font_size)
-                title_font = ImageFont.truetype("C:/Windows/Fonts/arialbd.ttf", font_size + 2)
-            except:
-                font = ImageFont.load_default()
-                small_font = font
-                title_font = font
-
-        if actual_radius > 0:
-            bbox = [center_x - actual_radius, center_y - actual_radius, center_x + actual_radius, center_y + actual_radius]
-            draw.ellipse(bbox, outline="#00FF00", width=4)
-            label_text = f"CLEAR ZONE: {actual_radius}px"
-            text_x = center_x - 60
-            text_y = int(center_y - actual_radius - small_font_size - 5)
-            if text_y > 5:
-                draw.rectangle([text_x - 2, text_y - 1, text_x + 130, text_y + small_font_size + 1], fill="#000000")
-                draw.text((text_x, text_y), label_text, fill="#00FF00", font=small_font)
-
-        fade_thresholds = [
-            (0.25, "#FFFF00", "25% fade"),
-            (0.50, "#FF8800", "50% fade"),
-            (0.75, "#FF0000", "75% fade"),
-            (1.0, "#FF00FF", "100% fade"),
-        ]
-
-        for fade_pct, color, label in fade_thresholds:
-            norm_fade = fade_pct ** (1 / vignette_strength)
-            actual_dist = actual_radius + (norm_fade * fade_range)
-
-            if actual_dist > 0 and actual_dist < max(width, height):
-                bbox = [center_x - actual_dist, center_y - actual_dist, center_x + actual_dist, center_y + actual_dist]
-                draw.ellipse(bbox, outline=color, width=2)
-
-        crosshair_size = max(30, base_size // 20)
-        draw.line([(center_x - crosshair_size, center_y), (center_x + crosshair_size, center_y)], fill="#00FFFF", width=2)
-        draw.line([(center_x, center_y - crosshair_size), (center_x, center_y + crosshair_size)], fill="#00FFFF", width=2)
-        draw.ellipse([center_x - 4, center_y - 4, center_x + 4, center_y + 4], fill="#00FFFF")
-
-        edge_points = [(0, center_y), (width - 1, center_y), (center_x, 0), (center_x, height - 1)]
-        for ex, ey in edge_points:
-            draw.line([(center_x, center_y), (ex, ey)], fill="#00FFFF", width=1)
-
-        corner_markers = [(0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1)]
-        for cx, cy in corner_markers:
-            m = 12
-            if cx == 0:
-                draw.line([(cx, cy), (cx + m, cy)], fill="#FFFFFF", width=2)
-            else:
-                draw.line([(cx, cy), (cx - m, cy)], fill="#FFFFFF", width=2)
-            if cy == 0:
-                draw.line([(cx, cy), (cx, cy + m)], fill="#FFFFFF", width=2)
-            else:
-                draw.line([(cx, cy), (cx, cy - m)], fill="#FFFFFF", width=2)
-
-        true_center_x = (width - 1) / 2.0
-        true_center_y = (height - 1) / 2.0
-        tl_dist = int(math.sqrt((0 - true_center_x)**2 + (0 - true_center_y)**2))
-        tr_dist = int(math.sqrt((width - 1 - true_center_x)**2 + (0 - true_center_y)**2))
-        bl_dist = int(math.sqrt((0 - true_center_x)**2 + (height - 1 - true_center_y)**2))
-        br_dist = int(math.sqrt((width - 1 - true_center_x)**2 + (height - 1 - true_center_y)**2))
-
-        line_height = small_font_size + 6
-        info_lines = [
-            ("DEBUG MODE", "#FF4444", title_font),
-            ("", None, None),
-            (f"Size: {width}x{height}", "#FFFFFF", small_font),
-            (f"Diagonal: {int(diagonal)}px", "#FFFFFF", small_font),
-            ("", None, None),
-            ("Settings:", "#00FFFF", small_font),
-            (f"Strength: {vignette_strength:.1f}", "#FFFF00", small_font),
-            (f"Radius Divisor: {diagonal_radius:.1f}", "#FFFF00", small_font),
-            ("", None, None),
-            ("Zones:", "#00FFFF", small_font),
-            (f"Clear Zone: {actual_radius}px", "#00FF00", small_font),
-            (f"Fade Range: {int(fade_range)}px", "#FF8800", small_font),
-            (f"Corner Dist: {int(corner_dist)}px", "#FFFFFF", small_font),
-            ("", None, None),
-            ("Legend:", "#00FFFF", small_font),
-            ("GREEN = Clear zone edge", "#00FF00", small_font),
-            ("YELLOW = 25% darkened", "#FFFF00", small_font),
-            ("ORANGE = 50% darkened", "#FF8800", small_font),
-            ("RED = 75% darkened", "#FF0000", small_font),
-            ("MAGENTA = 100% darkened", "#FF00FF", small_font),
-            ("", None, None),
-            ("Corners:", "#00FFFF", small_font),
-            (f"TL: {tl_dist}px  TR: {tr_dist}px", "#FFFFFF", small_font),
-            (f"BL: {bl_dist}px  BR: {br_dist}px", "#FFFFFF", small_font),
-        ]
-
-        panel_width = 450
-        panel_height = len(info_lines) * line_height + 15
-        panel_x = 8
-        panel_y = 8
-        
-        # Use NumPy for fast panel darkening instead of pixel-by-pixel loop
-        panel_x2 = min(panel_x + panel_width, width)
-        panel_y2 = min(panel_y + panel_height, height)
-        panel_region = result.crop((panel_x, panel_y, panel_x2, panel_y2))
-        panel_array = np.array(panel_region, dtype=np.uint8)
-        panel_array = panel_array // 3  # Darken by dividing by 3
-        darkened_panel = Image.fromarray(panel_array)
-        result.paste(darkened_panel, (panel_x, panel_y))
-        
-        draw = ImageDraw.Draw(result)
-        draw.rectangle([panel_x, panel_y, panel_x + panel_width, panel_y + panel_height], outline="#666666", width=1)
-        y_offset = panel_y + 8
-        for line_text, color, line_font in info_lines:
-            if line_text and color:
-                draw.text((panel_x + 8, y_offset), line_text, fill=color, font=line_font)
-            y_offset += line_height
-        return result
-
-    def process_images(self, path, step):
-        """Process all images in the specified path sequentially."""
-        global timings
-        timings.clear()
-
-        try:
-            progress_bar = ctk.CTkProgressBar(master=self.frame, width=400, height=20, fg_color=("#FF0000", "#B22222"), progress_color=("#32CD32", "#006400"), mode="determinate")
-            progress_bar.set(0)
-            progress_bar.place(relx=0.5, rely=0.84, anchor='center')
-
-            # Filter for actual image files only
-            valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp', '.gif'}
-            files = sorted([f for f in os.listdir(path) 
-                           if os.path.splitext(f)[1].lower() in valid_extensions])
-            files_to_process = [f for i, f in enumerate(files) if i % step == 0]
-            total_files = len(files_to_process)
-
-            if total_files == 0:
-                progress_bar.destroy()
-                return
-
-            # Get settings once
-            vignette_strength = float(self.widgets['vignette_strength_value'].get())
-            diagonal_radius = float(self.widgets['diagonal_radius_value'].get())
-            chosen_color = self.state.chosen_color
-            is_debug = self.state.debug_mode
-
-            processed = 0
-            failed = 0
-            stopped = False
-
-            # Process images sequentially
-            for img_name in files_to_process:
-                if self.state.stop_processing:
-                    stopped = True
-                    break
-
-                # Process single image
-                overall_start = time.time()
-                try:
-                    full_path = os.path.join(path, img_name)
-                    
-                    # Open image and get dimensions in one step
-                    with Image.open(full_path) as img:
-                        img = img.convert("RGB")
-                        width, height = img.size
-                        
-                        # Use hypot for faster diagonal calculation
-                        diagonal = math.hypot(width, height)
-                        radius = int(diagonal / diagonal_radius)
-                        strength = max(0.1, min(10.0, vignette_strength))
-
-                        # Time the mask creation
-                        start_time = time.time()
-                        vignette = create_circular_mask((width, height), radius, strength)
-                        end_time = time.time()
-                        timings.append({
-                            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
-                            'func_name': 'create_circular_mask',
-                            'execution_time': f"{end_time - start_time:.4f}"
-                        })
-
-                        # Create background color
-                        color_rgb = (0, 255, 0) if is_debug else hex_to_rgb(chosen_color)
-                        colored_bg = Image.new("RGB", (width, height), color_rgb)
-
-                        # Composite images
-                        result = Image.composite(img, colored_bg, vignette)
-
-                    # Time image save operation
-                    start_time = time.time()
-                    output_folder = 'processed_debug' if is_debug else 'processed'
-                    output_path = os.path.join(path, output_folder)
-                    os.makedirs(output_path, exist_ok=True)
-                    
-                    # Optimize save based on format
-                    save_path = os.path.join(output_path, img_name)
-                    ext = os.path.splitext(img_name)[1].lower()
-                    if ext in ('.jpg', '.jpeg'):
-                        result.save(save_path, quality=95, optimize=False, subsampling=0)
-                    elif ext == '.png':
-                        result.save(save_path, compress_level=1)  # Fast compression
-                    else:
-                        result.save(save_path)
-                        
-                    end_time = time.time()
-                    timings.append({
-                        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
-                        'func_name': 'save_image',
-                        'execution_time': f"{end_time - start_time:.4f}"
-                    })
-
-                    # Record overall processing time
-                    overall_end = time.time()
-                    timings.append({
-                        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
-                        'func_name': 'process_image',
-                        'execution_time': f"{overall_end - overall_start:.4f}"
-                    })
-
-                    processed += 1
-                except Exception as e:
-                    logging.error(f"Error processing {img_name}: {e}")
-                    overall_end = time.time()
-                    timings.append({
-                        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
-                        'func_name': 'process_image',
-                        'execution_time': f"{overall_end - overall_start:.4f}"
-                    })
-                    failed += 1
-
-                # Update progress for every image
-                progress = (processed + failed) / total_files
-                progress_bar.set(progress)
-                self.window.update()  # Update UI to show progress
-
-            progress_bar.destroy()
-
-            if self.state.label_complete:
-                self.state.label_complete.destroy()
-
-            if stopped:
-                self.state.label_complete = ctk.CTkLabel(master=self.frame, text='Processing stopped by user', font=("Helvetica", 13, "bold"), text_color="#FF9999")
-                self.state.stop_processing = False
+            settings = make_settings(**options['settings'])
+            presets = make_presets(options['presets'], **options['settings']) if options['presets'] else None
+            if is_archive(path):
+                # A ZIP or TAR path is processed into <name>_processed.zip/.tar next to it
+                summary = process_archive(
+                    path, step, settings,
+                    queue_depth=options['queue_depth'],
+                    output_folder=options['output_folder'],
+                    should_stop=lambda: self.state.stop_processing,
+                    on_result=update_progress,
+                    presets=presets,
+                )
             else:
-                msg = f'All images completed! ({processed} processed, {failed} failed)' if failed > 0 else 'All images completed!'
-                self.state.label_complete = ctk.CTkLabel(master=self.frame, text=msg, font=("Helvetica", 13, "bold"), text_color="#00FF00")
-                self._write_timing_to_csv()
-                # Send notification
-                notification.notify(
-                    title='Vignette Wizard',
-                    message=msg,
-                    timeout=5,
-                    app_icon=resource_path("icon.ico"),
+                summary = process_folder(
+                    path, step, settings,
+                    workers=options['workers'],
+                    queue_depth=options['queue_depth'],
+                    output_folder=options['output_folder'],
+                    should_stop=lambda: self.state.stop_processing,
+                    on_result=update_progress,
+                    resume=options['resume'],
+                    recursive=options['recursive'],
+                    memory_budget=options['memory_budget'],
+                    presets=presets,
                 )
+        except FileNotFoundError:
+            progress.put(('missing',))
+            return
+        except Exception as e:
+            logging.error(f"Error processing {path}: {e}")
+            progress.put(('error', str(e)))
+            return
 
-            self.state.label_complete.place(relx=0.5, rely=0.92, anchor='center')
-            self.state.label_complete.update()
+        if summary and not summary['stopped'] and summary['total']:
+            self._write_metrics()
+        progress.put(('done', summary))
 
-            self.state.processing = False
-            self.widgets['continue_button'].configure(state='normal')
-            self.window.deiconify()
-            self.window.after_idle(self.window.attributes, '-topmost', False)
+    def _drain_progress(self):
+        """Apply queued progress events on the Tk thread, then reschedule.
 
-        except FileNotFoundError:
-            if 'progress_bar' in locals():
-                progress_bar.destroy()
+        All events since the last tick are coalesced into one widget
+        update, so the UI cost does not grow with the number of images.
+        """
+        state = self.state
+        latest = None
+        finished = None
+        while True:
+            try:
+                event = state.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'image':
+                latest = event
+                state.images_done += 1
+                state.bytes_done += event[3]
+            else:
+                finished = event
+
+        if latest is not None:
+            _, done, total, _ = latest
+            self.widgets['progress_bar'].set(done / total if total else 0)
+            elapsed = time.perf_counter() - state.batch_started
+            if elapsed > 0 and not state.stop_processing:
+                rate = state.images_done / elapsed
+                text = f"{rate:.1f} images/s  ·  {state.bytes_done / elapsed / 1e6:.1f} MB/s"
+                if rate > 0 and total > done:
+                    eta = int((total - done) / rate)
+                    text += f"  ·  ETA {eta // 60}:{eta % 60:02d}"
+                self.widgets['progress_stats'].configure(text=text)
+
+        if finished is None:
+            self.window.after(self.PROGRESS_INTERVAL_MS, self._drain_progress)
+        elif finished[0] == 'missing':
+            self._end_progress()
             error_label = ctk.CTkLabel(master=self.frame, text='Incorrect path name\n\nCheck your path name and try again.', bg_color="#e0e0e0")
             error_label.place(relx=0.5, rely=0.7, anchor='center')
-            error_label.update()
-            self.widgets['continue_button'].configure(state='normal')
-            self.state.processing = False
+        elif finished[0] == 'error':
+            self._end_progress()
+            error_label = ctk.CTkLabel(master=self.frame, text=f'Processing failed\n\n{finished[1]}', bg_color="#e0e0e0", wraplength=440)
+            error_label.place(relx=0.5, rely=0.7, anchor='center')
+        else:
+            self._end_progress()
+            self._show_summary(finished[1])
+
+    def _end_progress(self):
+        """Remove the progress widgets and re-enable the start button."""
+        self.widgets.pop('progress_bar').destroy()
+        self.widgets.pop('progress_stats').destroy()
+        self.widgets['continue_button'].configure(state='normal')
+        self.state.processing = False
+        self.state.stop_processing = False
+
+    def _show_summary(self, summary):
+        """Show the result of a finished batch and send a notification."""
+        if summary is None or summary['total'] == 0:
+            return
+
+        processed = summary['processed']
+        failed = summary['failed']
+        skipped = summary['skipped']
+
+        if self.state.label_complete:
+            self.state.label_complete.destroy()
+
+        if summary['stopped']:
+            self.state.label_complete = ctk.CTkLabel(master=self.frame, text='Processing stopped by user', font=("Helvetica", 13, "bold"), text_color="#FF9999")
+        else:
+            msg = f'All images completed! ({processed} processed, {failed} failed)' if failed > 0 else 'All images completed!'
+            if skipped:
+                msg += f'\n{skipped} unchanged images skipped'
+            self.state.label_complete = ctk.CTkLabel(master=self.frame, text=msg, font=("Helvetica", 13, "bold"), text_color="#00FF00")
+            # plyer can block for a moment, keep it off the Tk thread
+            threading.Thread(target=self._notify, args=(msg,), daemon=True).start()
+
+        self.state.label_complete.place(relx=0.5, rely=0.92, anchor='center')
+        self.window.deiconify()
+        self.window.after_idle(self.window.attributes, '-topmost', False)
+
+    def _notify(self, msg):
+        """Send the desktop notification for a finished batch."""
+        from plyer import notification
+        notification.notify(
+            title='Vignette Wizard',
+            message=msg,
+            timeout=5,
+            app_icon=resource_path("icon.ico"),
+        )
+
+    def _batch_options(self):
+        """Read everything the worker needs from the widgets, on the Tk thread."""
+        is_debug = self.state.debug_mode
+        return {
+            'settings': {
+                'vignette_strength': self.widgets['vignette_strength_value'].get(),
+                'diagonal_radius': self.widgets['diagonal_radius_value'].get(),
+                'color': (0, 255, 0) if is_debug else self.state.chosen_color,
+                'mask_tolerance': self.settings.get("mask_tolerance", self.DEFAULT_SETTINGS["mask_tolerance"]),
+                'strip_threshold_mp': self.settings.get("strip_threshold_mp", self.DEFAULT_SETTINGS["strip_threshold_mp"]),
+                'strip_rows': self.settings.get("strip_rows", self.DEFAULT_SETTINGS["strip_rows"]),
+                'debug_overlay': is_debug,
+                'encoder': self.settings.get("encoder_profile", self.DEFAULT_SETTINGS["encoder_profile"]),
+                'keep_metadata': bool(self.settings.get("keep_metadata", self.DEFAULT_SETTINGS["keep_metadata"])),
+            },
+            'workers': int(self.settings.get("workers", self.DEFAULT_SETTINGS["workers"])),
+            'queue_depth': int(self.settings.get("queue_depth", self.DEFAULT_SETTINGS["queue_depth"])),
+            'output_folder': 'processed_debug' if is_debug else 'processed',
+            'resume': bool(self.settings.get("resume", self.DEFAULT_SETTINGS["resume"])),
+            'recursive': bool(self.settings.get("recursive", self.DEFAULT_SETTINGS["recursive"])),
+            'memory_budget': int(float(self.settings.get("memory_budget_mb", self.DEFAULT_SETTINGS["memory_budget_mb"])) * 1e6),
+            # Non-empty: one output subfolder per preset, see vignette.make_presets
+            'presets': list(self.settings.get("sweep_presets", self.DEFAULT_SETTINGS["sweep_presets"])),
+        }
 
     def handle_keypress(self, event=None):
         """Handle start processing button press."""
@@ -467,18 +320,32 @@ class VignetteApp:
 
         if self.state.label_complete:
             self.state.label_complete.destroy()
+            self.state.label_complete = None
 
         self.widgets['continue_button'].configure(state='disabled')
         self.state.processing = True
 
-        threading.Thread(target=self.process_images, args=(self.widgets['entry_path'].get(), int(self.widgets['spinbox_value'].get()))).start()
+        self.widgets['progress_bar'] = ctk.CTkProgressBar(master=self.frame, width=400, height=20, fg_color=("#FF0000", "#B22222"), progress_color=("#32CD32", "#006400"), mode="determinate")
+        self.widgets['progress_bar'].set(0)
+        self.widgets['progress_bar'].place(relx=0.5, rely=0.84, anchor='center')
+        self.widgets['progress_stats'] = ctk.CTkLabel(master=self.frame, text='Starting...', font=("Helvetica", 12))
+        self.widgets['progress_stats'].place(relx=0.5, rely=0.88, anchor='center')
+
+        self.state.progress_queue = queue.Queue()
+        self.state.images_done = 0
+        self.state.bytes_done = 0
+        self.state.batch_started = time.perf_counter()
+
+        args = (self.widgets['entry_path'].get(), int(self.widgets['spinbox_value'].get()), self._batch_options())
+        threading.Thread(target=self.process_images, args=args, daemon=True).start()
+        self.window.after(self.PROGRESS_INTERVAL_MS, self._drain_progress)
 
     def handle_esc_key(self, event=None):
         """Handle ESC key to stop processing."""
-        if self.state.processing:
+        if self.state.processing and not self.state.stop_processing:
+            # The button comes back once the worker has wound down
             self.state.stop_processing = True
-            self.state.processing = False
-            self.widgets['continue_button'].configure(state='normal')
+            self.widgets['progress_stats'].configure(text='Stopping...')
 
     def choose_color(self):
         """Open color chooser dialog."""
@@ -486,6 +353,7 @@ class VignetteApp:
         if color:
             self.state.chosen_color = color
             self.widgets['soft_edge_color'].configure(fg_color=self.state.chosen_color)
+            self._schedule_preview()
 
     def choose_folder(self):
         """Open folder picker dialog."""
@@ -493,44 +361,116 @@ class VignetteApp:
         if folder_selected:
             self.widgets['entry_path'].delete(0, tkinter.END)
             self.widgets['entry_path'].insert(0, folder_selected)
+            self._load_preview()
+
+    def _load_preview(self, event=None):
+        """Load the first image of the chosen folder into the preview pane."""
+        path = self.widgets['entry_path'].get().strip()
+        if not path or not os.path.isdir(path):
+            return
+        if self.state.preview is None:
+            from preview import PreviewRenderer
+            from vignette import allow_large_images
+            allow_large_images()
+            self.state.preview = PreviewRenderer(self.PREVIEW_SIZE)
+            self.window.after(self.PREVIEW_POLL_MS, self._poll_preview)
+        self.widgets['preview_stats'].configure(text="Loading preview...")
+        self.state.preview.load(path)
+        self._request_preview()
+
+    def _schedule_preview(self, *args):
+        """Re-render the preview once the settings stop changing for PREVIEW_DEBOUNCE_MS."""
+        if self.state.preview is None:
+            return
+        if self.state.preview_after is not None:
+            self.window.after_cancel(self.state.preview_after)
+        self.state.preview_after = self.window.after(self.PREVIEW_DEBOUNCE_MS, self._request_preview)
+
+    def _request_preview(self):
+        """Hand the current settings to the preview thread; half-typed values are ignored."""
+        self.state.preview_after = None
+        from vignette import make_settings
+        options = dict(self._batch_options()['settings'], debug_overlay=False)
+        try:
+            settings = make_settings(**options)
+        except (TypeError, ValueError):
+            return
+        self.state.preview.render(settings)
+
+    def _poll_preview(self):
+        """Show the newest finished preview on the Tk thread, then reschedule."""
+        latest = None
+        while True:
+            try:
+                latest = self.state.preview.results.get_nowait()
+            except queue.Empty:
+                break
+        if latest is not None and latest[0] == 'preview':
+            _, img, seconds = latest
+            image = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
+            self.widgets['preview_image'].configure(image=image, text="")
+            self.widgets['preview_image'].image = image
+            self.widgets['preview_stats'].configure(text=f"Rendered in {seconds * 1000:.0f} ms")
+        elif latest is not None:
+            self.widgets['preview_image'].configure(image=None, text=latest[1])
+            self.widgets['preview_stats'].configure(text="")
+        self.window.after(self.PREVIEW_POLL_MS, self._poll_preview)
 
     def toggle_debug_mode(self):
         """Toggle debug mode."""
         self.state.debug_mode = self.widgets['debug_checkbox_var'].get()
+        self._schedule_preview()
 
     def on_closing(self):
         """Handle window closing."""
         self.save_settings()
+        if self.state.preview is not None:
+            self.state.preview.close()
         self.window.destroy()
 
+    def _set_window_icon(self):
+        """Set the window icon from icon.ico, falling back to icon.png."""
+        try:
+            ico_path = resource_path("icon.ico")
+            if os.path.exists(ico_path):
+                self.window.iconbitmap(ico_path)
+            else:
+                png_path = resource_path("icon.png")
+                if os.path.exists(png_path):
+                    from PIL import Image, ImageTk
+                    ico = Image.open(png_path)
+                    self._icon_photo = ImageTk.PhotoImage(ico)
+                    self.window.iconphoto(True, self._icon_photo)
+        except Exception as e:
+            print(f"Could not set window icon: {e}")
+
     def setup_ui(self):
         """Setup the user interface."""
         ctk.set_appearance_mode("system")
         ctk.set_default_color_theme("blue")
 
         saved_settings = self.load_settings()
+        self.settings = saved_settings
         self.state.chosen_color = saved_settings.get("vignette_color", "#000000")
 
         self.window = ctk.CTk()
-        self.window.geometry("500x680")
+        self.window.geometry(f"{520 + self.PREVIEW_SIZE + 20}x680")
         self.window.resizable(False, False)
         self.window.title("Vignette Wizard - Image Processor")
-
-        try:
-            ico_path = resource_path("icon.ico")
-            if os.path.exists(ico_path):
-                self.window.iconbitmap(ico_path)
-            else:
-                png_path = resource_path("icon.png")
-                if os.path.exists(png_path):
-                    ico = Image.open(png_path)
-                    photo = ImageTk.PhotoImage(ico)
-                    self.window.iconphoto(True, photo)
-        except Exception as e:
-            print(f"Could not set window icon: {e}")
+        # The PNG fallback needs PIL, so set the icon once the window is up
+        self.window.after_idle(self._set_window_icon)
 
         self.frame = ctk.CTkFrame(master=self.window, width=500, height=680)
-        self.frame.pack(pady=10, padx=10, fill="both", expand=True)
+        self.frame.pack(side="left", pady=10, padx=10, fill="y")
+
+        preview_frame = ctk.CTkFrame(master=self.window, width=self.PREVIEW_SIZE + 20, height=680)
+        preview_frame.pack(side="right", pady=10, padx=(0, 10), fill="both", expand=True)
+        preview_label = ctk.CTkLabel(master=preview_frame, text='Preview', font=("Helvetica", 16, "bold"))
+        preview_label.place(relx=0.5, rely=0.05, anchor='center')
+        self.widgets['preview_image'] = ctk.CTkLabel(master=preview_frame, text="Choose a folder to see a preview", width=self.PREVIEW_SIZE, height=self.PREVIEW_SIZE, wraplength=self.PREVIEW_SIZE - 40)
+        self.widgets['preview_image'].place(relx=0.5, rely=0.45, anchor='center')
+        self.widgets['preview_stats'] = ctk.CTkLabel(master=preview_frame, text="", font=("Helvetica", 11))
+        self.widgets['preview_stats'].place(relx=0.5, rely=0.86, anchor='center')
 
         path_label = ctk.CTkLabel(master=self.frame, text='Please input path to images')
         path_label.place(relx=0.5, rely=0.05, anchor='center')
@@ -539,6 +479,7 @@ class VignetteApp:
         self.widgets['entry_path'] = ctk.CTkEntry(master=self.frame, width=350, height=35, placeholder_text="Enter folder path or use button below...")
         self.widgets['entry_path'].place(relx=0.5, rely=0.10, anchor='center')
         self.widgets['entry_path'].bind('<Return>', self.handle_keypress)
+        self.widgets['entry_path'].bind('<FocusOut>', self._load_preview)
 
         folder_picker_button = ctk.CTkButton(master=self.frame, text="Choose Folder", command=self.choose_folder, width=200, height=32)
         folder_picker_button.place(relx=0.5, rely=0.16, anchor='center')
@@ -569,6 +510,7 @@ class VignetteApp:
         vignette_strength_frame.place(relx=0.5, rely=0.39, anchor='center')
 
         self.widgets['vignette_strength_value'] = ctk.StringVar(value=saved_settings.get("vignette_strength", "2.5"))
+        self.widgets['vignette_strength_value'].trace_add('write', self._schedule_preview)
 
         vignette_strength_spinbox = ctk.CTkEntry(master=vignette_strength_frame, width=60, textvariable=self.widgets['vignette_strength_value'], justify="center")
         vignette_strength_spinbox.grid(row=0, column=1, padx=5)
@@ -587,6 +529,7 @@ class VignetteApp:
         diagonal_radius_frame.place(relx=0.5, rely=0.51, anchor='center')
 
         self.widgets['diagonal_radius_value'] = ctk.StringVar(value=saved_settings.get("diagonal_radius", "4.0"))
+        self.widgets['diagonal_radius_value'].trace_add('write', self._schedule_preview)
 
         diagonal_radius_spinbox = ctk.CTkEntry(master=diagonal_radius_frame, width=60, textvariable=self.widgets['diagonal_radius_value'], justify="center")
         diagonal_radius_spinbox.grid(row=0, column=1, padx=5)
@@ -671,52 +614,27 @@ class VignetteApp:
         except ValueError:
             self.widgets['diagonal_radius_value'].set("4.0")
 
-    def run(self):
+    def run(self, startup_report=False):
         """Run the application."""
+        if startup_report:
+            self.window.after_idle(self._report_startup)
         self.window.mainloop()
 
-    def _write_timing_to_csv(self):
-        """Write each function call as a row in the CSV."""
-        global timings
-
-        if not DEBUG_MODE or not timings:
-            timings.clear()
-            return
-
-        csv_file = "timing_log.csv"
-
-        existing_headers = []
-        existing_rows = []
-        if os.path.isfile(csv_file):
-            with open(csv_file, mode='r', newline='') as f:
-                reader = list(csv.reader(f))
-                if reader:
-                    existing_headers = reader[0]
-                    existing_rows = reader[1:]
-
-        all_function_names = sorted(set(list(existing_headers[1:]) + [t['func_name'] for t in timings]))
-        headers = ["Timestamp"] + all_function_names
-
-        new_rows = []
-        for timing in timings:
-            row = [timing['timestamp']]
-            for func_name in all_function_names:
-                if timing['func_name'] == func_name:
-                    row.append(timing['execution_time'])
-                else:
-                    row.append('')
-            new_rows.append(row)
+    def _report_startup(self):
+        """Print the startup-time breakdown once the window is idle, then exit."""
+        self.window.update_idletasks()
+        mark_startup("first idle")
+        print(report_startup())
+        self.window.destroy()
 
-        try:
-            with open(csv_file, mode='w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(headers)
-                writer.writerows(existing_rows)
-                writer.writerows(new_rows)
-            timings.clear()
-        except Exception as e:
-            logging.error(f"Error writing timing CSV: {e}")
+    def _write_metrics(self):
+        """Append this run's per-stage timings to the CSV log in debug mode."""
+        if DEBUG_MODE:
+            collector.persist(self.METRICS_FILE)
 
 if __name__ == "__main__":
+    # Worker processes of the frozen (PyInstaller) build re-enter here
+    multiprocessing.freeze_support()
     app = VignetteApp()
-    app.run()
\ No newline at end of file
+    # --startup-report prints where startup time went and exits
+    app.run(startup_report="--startup-report" in sys.argv[1:])
\ No newline at end of file